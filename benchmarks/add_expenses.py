@@ -0,0 +1,63 @@
+"""
+Benchmark of bulk expenses insertion against per-row add_expense calls.
+Run from repository root: python -m benchmarks.add_expenses [num_of_rows]
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from bookkeeper.models.abstract_expense_model import ExpenseRecord
+from bookkeeper.models.pony_models.pony_model import PonyModel
+
+
+def make_model(directory: str, name: str) -> PonyModel:
+    return PonyModel(
+        provider="sqlite", filename=os.path.join(directory, name), create_db=True
+    )
+
+
+def bench_per_row(model: PonyModel, records: list[ExpenseRecord]) -> float:
+    start = time.perf_counter()
+    for rec in records:
+        model.expenses_model.add_expense(
+            rec.amount, rec.category, rec.expense_date, rec.comment
+        )
+    return time.perf_counter() - start
+
+
+def bench_bulk(
+    model: PonyModel, records: list[ExpenseRecord], build_expenses: bool
+) -> float:
+    start = time.perf_counter()
+    model.expenses_model.add_expenses(records, build_expenses=build_expenses)
+    return time.perf_counter() - start
+
+
+def main(num_of_rows: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        cases = [
+            ("add_expense per row", bench_per_row),
+            ("add_expenses", lambda m, r: bench_bulk(m, r, True)),
+            ("add_expenses (ids only)", lambda m, r: bench_bulk(m, r, False)),
+        ]
+        for i, (caption, bench) in enumerate(cases):
+            model = make_model(directory, f"bench_{i}.sqlite")
+            category = model.category_model.add_category("Bench")
+            first_day = datetime(2023, 1, 1, 12, 0)
+            records = [
+                ExpenseRecord(
+                    amount=j % 1000 + 0.5,
+                    category=category,
+                    expense_date=first_day + timedelta(minutes=j * 20),
+                    comment=f"Bank record {j}",
+                )
+                for j in range(num_of_rows)
+            ]
+            elapsed = bench(model, records)
+            print(f"{caption:<25} {num_of_rows / elapsed:>12.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
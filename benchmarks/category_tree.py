@@ -0,0 +1,49 @@
+"""
+Benchmark of loading the whole category tree in depth-first order.
+Run from repository root: python -m benchmarks.category_tree [num_of_nodes]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from pony.orm import db_session
+
+from bookkeeper.models.pony_models.pony_model import PonyModel
+
+
+def fill_tree(model: PonyModel, num_of_nodes: int) -> None:
+    random.seed(0)
+    with db_session:
+        ids: list[int] = []
+        for i in range(num_of_nodes):
+            # About one of ten categories is a root, others hang on random parents
+            parent = None
+            if ids and random.random() > 0.1:
+                parent = model.db.Category[random.choice(ids)]
+            category = model.db.Category(name=f"category {i}", parent=parent)
+            category.flush()
+            ids.append(category.id)
+
+
+def main(num_of_nodes: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        model = PonyModel(
+            provider="sqlite",
+            filename=os.path.join(directory, "bench.sqlite"),
+            create_db=True,
+        )
+        fill_tree(model, num_of_nodes)
+        print(f"Tree of {num_of_nodes} categories")
+        # The first call includes query preparation, so it is reported apart
+        for label in ("get_all_categories, first", "get_all_categories, next"):
+            start = time.perf_counter()
+            categories = model.category_model.get_all_categories()
+            elapsed = time.perf_counter() - start
+            assert len(categories) == num_of_nodes
+            print(f"{label:<30} {elapsed * 1000:>10.2f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,58 @@
+"""
+Benchmark of range sums: SUM over raw expenses against daily totals.
+Run from repository root: python -m benchmarks.daily_totals [num_of_rows]
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, time as day_time, timedelta
+
+from pony.orm import db_session
+from pony.utils import datetime2timestamp
+
+from benchmarks.spent_budget import fill_ledger, measure
+from bookkeeper.models.pony_models.pony_model import PonyModel
+
+
+def main(num_of_rows: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        model = PonyModel(
+            provider="sqlite",
+            filename=os.path.join(directory, "bench.sqlite"),
+            create_db=True,
+        )
+        fill_ledger(model, num_of_rows)
+        end = datetime.combine(datetime.now(), day_time.max)
+        print(f"Ledger of {num_of_rows} expenses")
+        for days in (1, 31, 365):
+            start = datetime.combine(end - timedelta(days=days - 1), day_time.min)
+            # Mid-day boundaries make first and last days read from raw expenses
+            ranges = {"full days": (start, end), "partial": (start.replace(hour=12), end)}
+            for kind, (range_start, range_end) in ranges.items():
+                params = {
+                    "start": datetime2timestamp(range_start),
+                    "end": datetime2timestamp(range_end),
+                }
+
+                @db_session
+                def raw() -> float:
+                    return model.db.select(
+                        'SELECT coalesce(SUM("amount"), 0) FROM "Expense" '
+                        'WHERE "expense_date" >= $start AND "expense_date" <= $end',
+                        params,
+                    )[0]
+
+                def daily() -> float:
+                    return model.expenses_model.get_expense_amount_by_time_period(
+                        range_start, range_end
+                    )
+
+                assert abs(raw() - daily()) < 1e-6 * max(1.0, raw())
+                print(
+                    f"{days:>4} days, {kind:<10} raw {measure(raw) * 1000:>8.2f} ms, "
+                    f"daily totals {measure(daily) * 1000:>8.2f} ms"
+                )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500000)
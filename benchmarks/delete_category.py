@@ -0,0 +1,66 @@
+"""
+Benchmark of deleting a large category subtree with its expenses.
+Run from repository root: python -m benchmarks.delete_category [num_of_expenses]
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from bookkeeper.core import CategoryDeletePolicy, ExpensesHandlingPolicy
+from bookkeeper.models.abstract_expense_model import ExpenseRecord
+from bookkeeper.models.pony_models.pony_model import PonyModel
+
+
+def fill_subtree(model: PonyModel, num_of_expenses: int, parent=None):
+    """
+    Adds top category with 10 children, 10 grandchildren each,
+    and spreads expenses over all of them
+    """
+    cats = model.category_model
+    top = cats.add_category("Top", parent)
+    subtree = [top]
+    for i in range(10):
+        child = cats.add_category(f"child {i}", top)
+        subtree.append(child)
+        subtree.extend(cats.add_category(f"grandchild {j}", child) for j in range(10))
+    first_date = datetime.now() - timedelta(days=365)
+    model.expenses_model.add_expenses(
+        [
+            ExpenseRecord(1.5, subtree[i % len(subtree)], first_date + timedelta(hours=i))
+            for i in range(num_of_expenses)
+        ],
+        build_expenses=False,
+    )
+    return top
+
+
+def main(num_of_expenses: int) -> None:
+    cases = [
+        ("children and expenses deleted", None, ExpensesHandlingPolicy.delete),
+        ("expenses moved to parent", "Parent", ExpensesHandlingPolicy.move),
+    ]
+    print(f"Subtree of 111 categories with {num_of_expenses} expenses")
+    with tempfile.TemporaryDirectory() as directory:
+        for i, (label, parent_name, expense_handling) in enumerate(cases):
+            model = PonyModel(
+                provider="sqlite",
+                filename=os.path.join(directory, f"bench{i}.sqlite"),
+                create_db=True,
+            )
+            parent = None
+            if parent_name is not None:
+                parent = model.category_model.add_category(parent_name)
+            top = fill_subtree(model, num_of_expenses, parent)
+            start = time.perf_counter()
+            touched = model.category_model.delete_category(
+                top, CategoryDeletePolicy.delete, expense_handling
+            )
+            elapsed = time.perf_counter() - start
+            assert touched == (111, num_of_expenses)
+            print(f"{label:<32} {elapsed * 1000:>10.2f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,117 @@
+"""
+Benchmark of spent budget computation for day, week and month: three index
+range sums over raw expenses, one SUM(CASE ...) query over the month window
+(kept here for comparison only) and get_expense_amounts_by_time_periods.
+Run from repository root: python -m benchmarks.spent_budget [num_of_rows]
+"""
+import math
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, time as day_time, timedelta
+
+from pony.orm import db_session
+from pony.utils import datetime2timestamp
+
+from bookkeeper.models.abstract_expense_model import ExpenseRecord
+from bookkeeper.models.pony_models.pony_model import PonyModel
+
+
+def spent_periods() -> list[tuple[datetime, datetime]]:
+    end_of_day = datetime.combine(datetime.now(), day_time.max)
+    start_of_day = datetime.combine(end_of_day, day_time.min)
+    start_of_week = start_of_day - timedelta(days=end_of_day.weekday())
+    start_of_month = start_of_day.replace(day=1)
+    return [
+        (start_of_day, end_of_day),
+        (start_of_week, end_of_day),
+        (start_of_month, end_of_day),
+    ]
+
+
+def fill_ledger(model: PonyModel, num_of_rows: int) -> None:
+    category = model.category_model.add_category("Bench")
+    # Two years of history up to now
+    step = timedelta(days=730) / num_of_rows
+    first_date = datetime.now() - timedelta(days=730)
+    batch = 50000
+    for start in range(0, num_of_rows, batch):
+        model.expenses_model.add_expenses(
+            [
+                ExpenseRecord(i % 1000 + 0.5, category, first_date + step * i)
+                for i in range(start, min(start + batch, num_of_rows))
+            ],
+            build_expenses=False,
+        )
+
+
+def measure(func, repeat: int = 20) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def main(num_of_rows: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        model = PonyModel(
+            provider="sqlite",
+            filename=os.path.join(directory, "bench.sqlite"),
+            create_db=True,
+        )
+        fill_ledger(model, num_of_rows)
+        expenses_model = model.expenses_model
+        periods = spent_periods()
+
+        params = {
+            f"start{i}": datetime2timestamp(start) for i, (start, _) in enumerate(periods)
+        }
+        params["end"] = datetime2timestamp(periods[0][1])
+
+        @db_session
+        def range_sums() -> list[float]:
+            return [
+                model.db.select(
+                    'SELECT coalesce(SUM("amount"), 0) FROM "Expense" '
+                    f'WHERE "expense_date" >= $start{i} AND "expense_date" <= $end',
+                    params,
+                )[0]
+                for i in range(len(periods))
+            ]
+
+        @db_session
+        def sum_case() -> list[float]:
+            sums = ", ".join(
+                f'coalesce(SUM(CASE WHEN "expense_date" >= $start{i} '
+                'THEN "amount" END), 0)'
+                for i in range(len(periods))
+            )
+            # Month window is the widest one
+            return list(
+                model.db.select(
+                    f'SELECT {sums} FROM "Expense" '
+                    f'WHERE "expense_date" >= $start{len(periods) - 1} '
+                    'AND "expense_date" <= $end',
+                    params,
+                )[0]
+            )
+
+        def combined() -> list[float]:
+            return expenses_model.get_expense_amounts_by_time_periods(periods)
+
+        expected = combined()
+        for result in (range_sums(), sum_case()):
+            assert all(math.isclose(a, b, rel_tol=1e-9) for a, b in zip(result, expected))
+        print(f"Ledger of {num_of_rows} expenses")
+        print(f"{'three range sums':<25} {measure(range_sums) * 1000:>10.2f} ms")
+        print(f"{'one SUM(CASE) query':<25} {measure(sum_case) * 1000:>10.2f} ms")
+        print(f"{'daily totals query':<25} {measure(combined) * 1000:>10.2f} ms")
+        print(
+            f"{'update_spent_budget':<25} "
+            f"{measure(model.budget_model.update_spent_budget) * 1000:>10.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500000)
@@ -0,0 +1,74 @@
+"""
+Benchmark of SQLiteRepository against MemoryRepository.
+Run from repository root: python -m benchmarks.sqlite_repository [num_of_rows]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.spent_budget import measure
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+
+NUM_OF_CATEGORIES = 100
+
+
+def make_expenses(num_of_rows: int) -> list[Expense]:
+    random.seed(0)
+    now = datetime.now()
+    return [
+        Expense(
+            random.randint(1, 1000),
+            random.randint(1, NUM_OF_CATEGORIES),
+            now - timedelta(minutes=i),
+        )
+        for i in range(num_of_rows)
+    ]
+
+
+def timed(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main(num_of_rows: int) -> None:
+    if num_of_rows < 2:
+        raise ValueError("At least 2 rows are needed to measure single and batch adds")
+    with tempfile.TemporaryDirectory() as directory:
+        repos = {
+            "memory": MemoryRepository[Expense](),
+            "memory indexed": MemoryRepository[Expense](indexed=["category"]),
+            "sqlite": SQLiteRepository(
+                os.path.join(directory, "bench.sqlite"), Expense, indexed=["category"]
+            ),
+        }
+        # Both single and batch adds get some of rows
+        one_by_one = min(num_of_rows // 2, 10000)
+        print(f"Repository of {num_of_rows} expenses, {NUM_OF_CATEGORIES} categories")
+        for name, repo in repos.items():
+            single = make_expenses(one_by_one)
+            add = timed(lambda: [repo.add(exp) for exp in single])
+            batch = make_expenses(num_of_rows - one_by_one)
+            add_many = timed(lambda: repo.add_many(batch))
+            expenses = single + batch
+            update_many = timed(lambda: repo.update_many(expenses))
+            pks = [exp.pk for exp in random.sample(expenses, min(len(expenses), 1000))]
+            get = measure(lambda: [repo.get(pk) for pk in pks], repeat=5) / len(pks)
+            where = measure(lambda: repo.get_all({"category": 1}), repeat=5)
+            print(
+                f"{name:<14} add {one_by_one / add:>9.0f} rows/s, "
+                f"add_many {len(batch) / add_many:>9.0f} rows/s, "
+                f"update_many {len(expenses) / update_many:>9.0f} rows/s, "
+                f"get {get * 1e6:>6.1f} us, "
+                f"get_all(where) {where * 1000:>7.2f} ms"
+            )
+        repos["sqlite"].close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -10,6 +10,10 @@ class ConstraintError(TypeError):
     ...
 
 
+class CategoryCycleError(ValueError):
+    ...
+
+
 class GUIError(Exception):
     ...
 
@@ -1,8 +1,11 @@
 from __future__ import annotations
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from datetime import datetime
 from typing import Optional
 from typing import Protocol
 
+from bookkeeper.models.abstract_category_model import AbstractCategory
+
 
 @dataclass
 class AbstractBudget(Protocol):
@@ -13,6 +16,10 @@ class AbstractBudget(Protocol):
     weekly: float
     monthly: float
     exceeded: list[bool]
+    # Category budget limits expenses of the category with its subcategories
+    category_id: Optional[int] = None
+    # Spent (daily, weekly, monthly) the budget is checked against
+    spent: list[float] = field(default_factory=list)
 
     def update(self):
         self.model.update_budget(self)
@@ -27,7 +34,11 @@ class AbstractBudget(Protocol):
 
 class AbstractBudgetModel(Protocol):
     def add_budget(
-        preset: str, daily: float, weekly: float, monthly: float
+        preset: str,
+        daily: float,
+        weekly: float,
+        monthly: float,
+        category: Optional[AbstractCategory] = None,
     ) -> AbstractBudget:
         ...
 
@@ -37,13 +48,38 @@ class AbstractBudgetModel(Protocol):
     def get_budgets_by_ids(self, budget_ids: list[int]) -> list[AbstractBudget]:
         ...
 
+    def get_all_budgets(self) -> list[AbstractBudget]:
+        """
+        Returns all budgets including spent one
+        """
+        ...
+
     def get_budget_preset(self, preset: str) -> Optional[AbstractBudget]:
         ...
 
     def update_budget(self, budget: AbstractBudget) -> None:
         ...
 
-    def update_spent_budget(self) -> None:
+    def update_spent_budget(self) -> bool:
+        """
+        Recomputes spent budget from scratch.
+        Returns True if previously stored figures differed (drifted)
+        """
+        ...
+
+    def apply_spent_deltas(self, deltas: list[tuple[datetime, float]]) -> None:
+        """
+        Updates spent budget without rescanning expenses. Each delta is
+        (expense_date, amount change) of an added, changed or deleted expense.
+        Spent budget is recomputed if the day is over.
+        """
+        ...
+
+    def get_spent_rollover(self) -> datetime:
+        """
+        Returns the moment current day ends. New week and month can only start
+        then too, so spent budget should be recomputed at this moment.
+        """
         ...
 
     def get_spent_budget(self) -> None:
@@ -2,7 +2,7 @@ from __future__ import annotations
 from typing_extensions import Self
 import typing
 from enum import Enum
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from bookkeeper.core import CategoryDeletePolicy
 
 
@@ -16,6 +16,8 @@ class AbstractCategory(typing.Protocol):
     model: AbstractCategoryModel
     id: int
     name: str
+    # Id of parent category at the moment of loading, not compared
+    parent_id: typing.Optional[int] = field(default=None, compare=False)
 
     def get_children(self) -> list[Self]: ...
 
@@ -39,6 +41,20 @@ class AbstractCategoryModel(typing.Protocol):
 
     def get_all_categories(self) -> list[AbstractCategory]: ...
 
+    def get_ancestors(self, category: AbstractCategory) -> list[AbstractCategory]:
+        """
+        Returns all parents of category from the closest one up to the root
+        """
+        ...
+
+    def is_in_subtree(
+        self, category: AbstractCategory, ancestor: AbstractCategory
+    ) -> bool:
+        """
+        Checks if category is ancestor itself or one of its descendants
+        """
+        ...
+
     def add_category(
         self, name: str, parent: typing.Optional[AbstractCategory] = None
     ) -> AbstractCategory: ...
@@ -60,4 +76,8 @@ class AbstractCategoryModel(typing.Protocol):
 
     def update_category(
         self, cat: AbstractCategory, upd_data: dict[CategoryField, typing.Any]
-    ) -> AbstractCategory: ...
+    ) -> AbstractCategory:
+        """
+        Raises CategoryCycleError if new parent is within subtree of category
+        """
+        ...
@@ -1,8 +1,8 @@
 from __future__ import annotations
-from typing import Protocol, Any, Optional
+from typing import Protocol, Any, Iterator, Optional
 from dataclasses import dataclass, field
 from bookkeeper.models.abstract_category_model import AbstractCategory
-from datetime import datetime
+from datetime import date, datetime
 from enum import Enum, IntFlag
 
 
@@ -17,6 +17,8 @@ class AbstractExpense(Protocol):
     expense_date - дата расхода
     added_date - дата добавления в бд
     comment - комментарий
+    category_id, category_name - id и название категории на момент загрузки
+    category_label - полный путь категории "A > B > C" на момент загрузки
     """
 
     model: AbstractExpensesModel
@@ -26,6 +28,9 @@ class AbstractExpense(Protocol):
     expense_date: datetime = field(default_factory=datetime.now)
     added_date: datetime = field(default_factory=datetime.now)
     comment: str = ""
+    category_id: Optional[int] = None
+    category_name: str = ""
+    category_label: str = ""
 
     def set_attribute(self, attr_name: str, value: Any) -> None:
         self.model.set_attributes(self, {attr_name: value})
@@ -44,6 +49,11 @@ class ConstraintType(IntFlag):
     geq: int = 6
     leq: int = 3
     neq: int = 5
+    # Category or any of its subcategories, valid only for category field
+    in_subtree: int = 8
+    # Full-text search of all words or word prefixes, valid only for comment field
+    match: int = 16
+    prefix: int = 32
 
 
 class ExpenseField(str, Enum):
@@ -54,12 +64,19 @@ class ExpenseField(str, Enum):
     comment: str = "comment"
 
 
+class SeriesBucket(str, Enum):
+    day: str = "day"
+    week: str = "week"
+    month: str = "month"
+
+
 @dataclass
 class ExpenseConstraint:
     """
     A constraint for select_expenses_by_constraints model function
     expense_field: the name of attribute on which constraint is set
-    constraint_type: like / eq / geq / greater / leq / lower
+    constraint_type: like / eq / geq / greater / leq / lower / in_subtree /
+                     match / prefix
     expression: with which to compare
     """
 
@@ -68,15 +85,65 @@ class ExpenseConstraint:
     expression: Any
 
 
+@dataclass
+class ExpenseRecord:
+    """
+    A single expense for add_expenses model function
+    amount: сумма
+    category: категория расходов
+    expense_date: дата расхода (now if not provided)
+    comment: комментарий
+    """
+
+    amount: float
+    category: AbstractCategory
+    expense_date: Optional[datetime] = None
+    comment: Optional[str] = None
+
+
+@dataclass
+class ExpensesPage:
+    """
+    A page of expenses returned by get_expenses_page model function
+    expenses: expenses of the page, the newest first
+    next_cursor: opaque token for the next page, None for the last page
+    """
+
+    expenses: list[AbstractExpense]
+    next_cursor: Optional[str] = None
+
+
 class AbstractExpensesModel(Protocol):
     def add_expense(
         self, amount: int, category: AbstractCategory, expense_date: datetime
     ) -> AbstractExpense: ...
 
+    def add_expenses(
+        self, records: list[ExpenseRecord], build_expenses: bool = True
+    ) -> list[AbstractExpense] | list[int]:
+        """
+        Adds all records within one transaction.
+        Returns added expenses, or only their ids if build_expenses is False
+        """
+        ...
+
     def delete_expense(self, expense: AbstractExpense) -> None: ...
 
     def delete_expenses(self, expenses: list[AbstractExpense]) -> None: ...
 
+    def delete_expenses_by_ids(self, ids: list[int]) -> int:
+        """
+        Deletes expenses with ids provided, returns number of deleted expenses
+        """
+        ...
+
+    def update_expenses(self, ids: list[int], attr_dict: dict[ExpenseField, Any]) -> int:
+        """
+        Sets the same attributes for all expenses with ids provided,
+        returns number of updated expenses
+        """
+        ...
+
     def set_attributes(
         self, expense: AbstractExpense, attr_dict: dict[ExpenseField, Any]
     ) -> None: ...
@@ -90,6 +157,41 @@ class AbstractExpensesModel(Protocol):
         self, constraints: list[ExpenseConstraint], max_num: Optional[int] = None
     ) -> list[AbstractExpense]: ...
 
+    def iter_expenses_by_constraints(
+        self, constraints: list[ExpenseConstraint], chunk_size: int = 500
+    ) -> Iterator[AbstractExpense]:
+        """
+        Same as get_expenses_by_constraints, but yields expenses lazily
+        fetching them from database by chunks
+        """
+        ...
+
+    def get_expenses_page(
+        self,
+        constraints: list[ExpenseConstraint],
+        page_size: int,
+        cursor: Optional[str] = None,
+    ) -> ExpensesPage:
+        """
+        Returns page of expenses satisfying constraints ordered by expense_date
+        descending. The next page is requested with next_cursor of the previous one.
+        """
+        ...
+
+    def search_expenses(
+        self,
+        text: str,
+        constraints: Optional[list[ExpenseConstraint]] = None,
+        max_num: Optional[int] = None,
+        prefix: bool = False,
+    ) -> list[AbstractExpense]:
+        """
+        Returns expenses with comments containing all words from text
+        (or words starting with them if prefix is True), which also satisfy
+        constraints. The most relevant expenses go first.
+        """
+        ...
+
     def get_expense_category(self, expense: AbstractExpense) -> AbstractCategory: ...
 
     def get_expense_amount_by_time_period(self, start: datetime, end: datetime) -> float:
@@ -97,3 +199,46 @@ class AbstractExpensesModel(Protocol):
         Returns amount of all expences within specified time range
         """
         ...
+
+    def get_expense_amounts_by_time_periods(
+        self, periods: list[tuple[datetime, datetime]]
+    ) -> list[float]:
+        """
+        Returns amounts of all expences for each of (start, end) time ranges
+        """
+        ...
+
+    def get_expense_totals_by_category(
+        self, start: datetime, end: datetime, rollup: bool = False
+    ) -> dict[int, float]:
+        """
+        Returns amounts of expences within specified time range by category ids.
+        Only categories with expenses are present, unless rollup is True:
+        then every category is reported with total of its whole subtree
+        """
+        ...
+
+    def get_expense_totals_by_category_for_days(
+        self, periods: list[tuple[date, date]], rollup: bool = False
+    ) -> dict[int, list[float]]:
+        """
+        Same as get_expense_totals_by_category, but for several periods at once.
+        Periods are (first_day, last_day) including both, amounts are listed
+        in order of periods.
+        """
+        ...
+
+    def get_expense_series(
+        self,
+        start: datetime,
+        end: datetime,
+        bucket: SeriesBucket = SeriesBucket.day,
+        category: Optional[AbstractCategory] = None,
+    ) -> list[float]:
+        """
+        Returns amounts of expences within specified time range split by buckets.
+        Buckets are consecutive days, weeks (from monday) or calendar months,
+        the first one contains start and the last one contains end.
+        Buckets without expenses are filled with zeros.
+        """
+        ...
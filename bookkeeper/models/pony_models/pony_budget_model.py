@@ -7,6 +7,8 @@ from pony.orm import Database, db_session, ObjectNotFound, select
 
 from bookkeeper.models.abstract_model import AbstractModel
 from bookkeeper.models.abstract_budget_model import AbstractBudgetModel, AbstractBudget
+from bookkeeper.models.abstract_category_model import AbstractCategory
+from bookkeeper.models.pony_models.pony_utils import select_by_ids
 from bookkeeper.exceptions import NoDataError
 
 
@@ -17,11 +19,16 @@ class PonyBudget(AbstractBudget):
 
 class PonyBudgetModel(AbstractBudgetModel):
     _BUDGET_SPENT_GEN_PRESET: str = "BUDGET_SPENT_GEN_PRESET"
+    # Tolerance for float error accumulated by incremental updates
+    _SPENT_DRIFT_TOLERANCE: float = 1e-6
 
     @db_session
     def __init__(self, model: AbstractModel, db: Database):
         self.model = model
         self.db = db
+        # (start_of_day, start_of_week, start_of_month, end_of_day) spent budget
+        # is currently computed for
+        self._spent_periods: Optional[tuple[datetime, ...]] = None
         self._budget_spent_id = select(
             b.id for b in self.db.Budget if b.preset == self._BUDGET_SPENT_GEN_PRESET
         ).first()
@@ -29,11 +36,17 @@ class PonyBudgetModel(AbstractBudgetModel):
             budget_spent = self.db.Budget(preset=self._BUDGET_SPENT_GEN_PRESET)
             budget_spent.flush()
             self._budget_spent_id = budget_spent.id
-            self.update_spent_budget()
-            budget_spent.flush()
+        # Stored figures may be left from another day
+        self.update_spent_budget()
 
     @db_session
-    def _form_pony_budget(self, budget: Self.db.Budget) -> PonyBudget:
+    def _form_pony_budget(
+        self,
+        budget: Self.db.Budget,
+        budget_spent: Optional[Self.db.Budget] = None,
+        category_spent: Optional[dict[int, list[float]]] = None,
+    ) -> PonyBudget:
+        spent = self._get_spent_for(budget, budget_spent, category_spent)
         return PonyBudget(
             id=budget.id,
             model=self,
@@ -41,39 +54,63 @@ class PonyBudgetModel(AbstractBudgetModel):
             daily=budget.daily,
             weekly=budget.weekly,
             monthly=budget.monthly,
-            exceeded=self.check_if_exceed(budget),
+            exceeded=self.check_if_exceed(budget, spent),
+            category_id=None if budget.category is None else budget.category.id,
+            spent=spent,
         )
 
+    @db_session
+    def _form_pony_budgets(self, budgets: list[Self.db.Budget]) -> list[PonyBudget]:
+        """
+        Forms budgets loading spent budget and spendings by categories only once
+        """
+        budget_spent = self._get_budget_spent()
+        category_spent = None
+        if any(budget.category is not None for budget in budgets):
+            category_spent = self._get_category_spent()
+        return [
+            self._form_pony_budget(budget, budget_spent, category_spent)
+            for budget in budgets
+        ]
+
     @db_session
     def add_budget(
-        self, preset: str, daily: float, weekly: float, monthly: float
+        self,
+        preset: str,
+        daily: float,
+        weekly: float,
+        monthly: float,
+        category: Optional[AbstractCategory] = None,
     ) -> PonyBudget:
         added_budget = self.db.Budget(
             preset=preset,
             daily=daily,
             weekly=weekly,
             monthly=monthly,
+            category=None if category is None else self.db.Category[category.id],
         )
         added_budget.flush()
         return self._form_pony_budget(added_budget)
 
     @db_session
     def get_budgets_by_ids(self, budget_ids: list[int]) -> list[PonyBudget]:
-        result = []
-        fail = False
-        for id in budget_ids:
-            try:
-                loaded_budget = self.db.Budget[id]
-                result.append(self._form_pony_budget(loaded_budget))
-            except ObjectNotFound:
-                fail = True
-        if fail:
+        loaded = select_by_ids(self.db.Budget, budget_ids)
+        result = self._form_pony_budgets(
+            [loaded[id] for id in budget_ids if id in loaded]
+        )
+        if len(result) != len(budget_ids):
             raise NoDataError(
                 ("There is no budgets in database for one or more ids provided"),
                 result,
             )
         return result
 
+    @db_session
+    def get_all_budgets(self) -> list[PonyBudget]:
+        return self._form_pony_budgets(
+            list(self.db.Budget.select().order_by(self.db.Budget.id))
+        )
+
     @db_session
     def get_budget_preset(self, preset: str) -> Optional[PonyBudget]:
         result = self.db.Budget.select(lambda b: b.preset == preset).first()
@@ -91,36 +128,113 @@ class PonyBudgetModel(AbstractBudgetModel):
         budget_to_upd.daily = budget.daily
         budget_to_upd.weekly = budget.weekly
         budget_to_upd.monthly = budget.monthly
+        budget_to_upd.category = (
+            None if budget.category_id is None else self.db.Category[budget.category_id]
+        )
         budget_to_upd.flush()
         budget.exceeded = self._form_pony_budget(budget_to_upd).exceeded
 
-    @db_session
-    def update_spent_budget(self) -> None:
-        end_of_day = datetime.combine(datetime.now(), time.max)
+    @staticmethod
+    def _form_spent_periods(now: datetime) -> tuple[datetime, ...]:
+        end_of_day = datetime.combine(now, time.max)
         start_of_day = datetime.combine(end_of_day, time.min)
         start_of_week = start_of_day - timedelta(days=end_of_day.weekday())
         start_of_month = start_of_day.replace(day=1)
-        self.db.Budget[self._budget_spent_id].set(
-            daily=self.model.expenses_model.get_expense_amount_by_time_period(
-                start_of_day, end_of_day
-            ),
-            weekly=self.model.expenses_model.get_expense_amount_by_time_period(
-                start_of_week, end_of_day
-            ),
-            monthly=self.model.expenses_model.get_expense_amount_by_time_period(
-                start_of_month, end_of_day
-            ),
+        return (start_of_day, start_of_week, start_of_month, end_of_day)
+
+    @db_session
+    def update_spent_budget(self) -> bool:
+        if self._spent_outdated():
+            self._spent_periods = self._form_spent_periods(datetime.now())
+        *starts, end_of_day = self._spent_periods
+        amounts = self.model.expenses_model.get_expense_amounts_by_time_periods(
+            [(start, end_of_day) for start in starts]
+        )
+        budget_spent = self.db.Budget[self._budget_spent_id]
+        stored = (budget_spent.daily, budget_spent.weekly, budget_spent.monthly)
+        drifted = any(
+            old is None or abs(old - new) > self._SPENT_DRIFT_TOLERANCE
+            for old, new in zip(stored, amounts)
         )
+        budget_spent.set(daily=amounts[0], weekly=amounts[1], monthly=amounts[2])
+        return drifted
+
+    @db_session
+    def apply_spent_deltas(self, deltas: list[tuple[datetime, float]]) -> None:
+        if self._spent_outdated():
+            # Expenses are already changed, so recomputing takes deltas into account
+            self.update_spent_budget()
+            return
+        *starts, end_of_day = self._spent_periods
+        sums = [0.0, 0.0, 0.0]
+        for expense_date, delta in deltas:
+            if expense_date > end_of_day:
+                continue
+            for i, start in enumerate(starts):
+                if expense_date >= start:
+                    sums[i] += delta
+        if not any(sums):
+            return
+        budget_spent = self.db.Budget[self._budget_spent_id]
+        budget_spent.set(
+            daily=budget_spent.daily + sums[0],
+            weekly=budget_spent.weekly + sums[1],
+            monthly=budget_spent.monthly + sums[2],
+        )
+
+    @db_session
+    def get_spent_rollover(self) -> datetime:
+        if self._spent_outdated():
+            self.update_spent_budget()
+        return self._spent_periods[-1] + timedelta(microseconds=1)
+
+    def _spent_outdated(self) -> bool:
+        return self._spent_periods is None or datetime.now() > self._spent_periods[-1]
+
+    @db_session
+    def _get_budget_spent(self) -> Self.db.Budget:
+        if self._spent_outdated():
+            self.update_spent_budget()
+        return self.db.Budget[self._budget_spent_id]
 
     @db_session
     def get_spent_budget(self) -> None:
-        return self._form_pony_budget(self.db.Budget[self._budget_spent_id])
+        return self._form_pony_budget(self._get_budget_spent())
 
     @db_session
-    def check_if_exceed(self, budget: Self.db.Budget) -> list[bool]:
-        budget_spent = self.db.Budget[self._budget_spent_id]
+    def _get_category_spent(self) -> dict[int, list[float]]:
+        """
+        Spent (daily, weekly, monthly) of every category with its subcategories
+        """
+        self._get_budget_spent()  # Periods are renewed if the day is over
+        *starts, end_of_day = self._spent_periods
+        return self.model.expenses_model.get_expense_totals_by_category_for_days(
+            [(start.date(), end_of_day.date()) for start in starts], rollup=True
+        )
+
+    @db_session
+    def _get_spent_for(
+        self,
+        budget: Self.db.Budget,
+        budget_spent: Optional[Self.db.Budget] = None,
+        category_spent: Optional[dict[int, list[float]]] = None,
+    ) -> list[float]:
+        if budget.category is None:
+            if budget_spent is None:
+                budget_spent = self._get_budget_spent()
+            return [budget_spent.daily, budget_spent.weekly, budget_spent.monthly]
+        if category_spent is None:
+            category_spent = self._get_category_spent()
+        return category_spent.get(budget.category.id, [0.0, 0.0, 0.0])
+
+    @db_session
+    def check_if_exceed(
+        self, budget: Self.db.Budget, spent: Optional[list[float]] = None
+    ) -> list[bool]:
+        if spent is None:
+            spent = self._get_spent_for(budget)
         return [
-            budget_spent.daily <= budget.daily,
-            budget_spent.weekly <= budget.weekly,
-            budget_spent.monthly <= budget.monthly,
+            spent[0] <= budget.daily,
+            spent[1] <= budget.weekly,
+            spent[2] <= budget.monthly,
         ]
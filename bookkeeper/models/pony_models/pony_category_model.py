@@ -1,6 +1,7 @@
 from __future__ import annotations
 from pony.orm import db_session, Database, Optional
-from pony.orm.core import ObjectNotFound
+from collections import defaultdict
+import bisect
 import typing
 from typing_extensions import Self
 from dataclasses import dataclass
@@ -15,7 +16,12 @@ from bookkeeper.core import (
     ExpensesHandlingPolicy,
 )
 from bookkeeper.models.abstract_model import AbstractModel
-from bookkeeper.exceptions import NoDataError
+from bookkeeper.models.pony_models.pony_utils import (
+    SQLITE_MAX_VARIABLES,
+    chunked,
+    sql_list_params,
+)
+from bookkeeper.exceptions import CategoryCycleError, NoDataError
 
 
 @dataclass
@@ -48,10 +54,97 @@ class PonyCategory(AbstractCategory):
         return self.id
 
 
+@dataclass
+class CategoryCacheInfo:
+    """
+    Statistics of categories cache
+    hits - reads served from memory
+    misses - reads which loaded categories from database
+    size - number of categories cached
+    """
+
+    hits: int
+    misses: int
+    size: int
+
+
+class _CategoryTree:
+    """
+    In-memory copy of categories: names, parents and children (ordered by id)
+    """
+
+    def __init__(self, rows: list[tuple[int, str, typing.Optional[int]]]):
+        self.names: dict[int, str] = {}
+        self.parents: dict[int, typing.Optional[int]] = {}
+        self.children: dict[typing.Optional[int], list[int]] = defaultdict(list)
+        for id, name, parent in sorted(rows):
+            self.add(id, name, parent)
+
+    def add(self, id: int, name: str, parent: typing.Optional[int]) -> None:
+        self.names[id] = name
+        self.parents[id] = parent
+        bisect.insort(self.children[parent], id)
+
+    def move(self, id: int, parent: typing.Optional[int]) -> None:
+        self.children[self.parents[id]].remove(id)
+        self.parents[id] = parent
+        bisect.insort(self.children[parent], id)
+
+    def remove(self, id: int) -> None:
+        self.children[self.parents.pop(id)].remove(id)
+        del self.names[id]
+        # Database sets parent of remaining children to NULL
+        for child in self.children.pop(id, []):
+            self.parents[child] = None
+            bisect.insort(self.children[None], child)
+
+    def subtree(self, id: typing.Optional[int] = None) -> list[int]:
+        """
+        Ids of category and all its descendants (all ids if None) in depth-first order
+        """
+        stack = list(reversed(self.children[None])) if id is None else [id]
+        result = []
+        while stack:
+            id = stack.pop()
+            result.append(id)
+            # Reversed, so the first child is popped first
+            stack.extend(reversed(self.children.get(id, [])))
+        return result
+
+
 class PonyCategoryModel(AbstractCategoryModel):
     def __init__(self, model: AbstractModel, database: Database):
         self.model = model
         self.db = database
+        # Loaded on first read, then kept up to date by writes of this model
+        self._tree: typing.Optional[_CategoryTree] = None
+        self._cache_hits = 0
+        self._cache_misses = 0
+
+    @db_session
+    def _get_tree(self) -> _CategoryTree:
+        if self._tree is None:
+            self._cache_misses += 1
+            self._tree = _CategoryTree(
+                self.db.select('SELECT "id", "name", "parent" FROM "Category"')
+            )
+        else:
+            self._cache_hits += 1
+        return self._tree
+
+    def get_cache_info(self) -> CategoryCacheInfo:
+        return CategoryCacheInfo(
+            hits=self._cache_hits,
+            misses=self._cache_misses,
+            size=0 if self._tree is None else len(self._tree.names),
+        )
+
+    def invalidate_cache(self) -> None:
+        """
+        Drops cached categories, e.g. after rolled back transaction.
+        They are loaded from database again on the next read.
+        """
+        self._tree = None
 
     @db_session
     def add_category(
@@ -62,6 +155,8 @@ class PonyCategoryModel(AbstractCategoryModel):
             parent_category = self.db.Category[parent.id]
         new_category = self.db.Category(name=name, parent=parent_category)
         new_category.flush()
+        if self._tree is not None:
+            self._tree.add(new_category.id, name, None if parent is None else parent.id)
         return self._form_ponycat(new_category)
 
     @db_session
@@ -71,13 +166,25 @@ class PonyCategoryModel(AbstractCategoryModel):
         children_policy: CategoryDeletePolicy = CategoryDeletePolicy.delete,
         expense_handling: ExpensesHandlingPolicy = ExpensesHandlingPolicy.delete,
     ) -> tuple[int, int]:
-        cat_to_del = self.db.Category[cat.id]
-        (cat_touched, exp_touched) = self._del_cat(
-            cat_to_del,
-            children_policy=children_policy,
-            expense_handling=expense_handling,
-            parent_for_exps=cat_to_del.parent,
+        rows = self.db.select(
+            'SELECT "parent" FROM "Category" WHERE "id" = $id', {"id": cat.id}
         )
+        if not rows:
+            raise NoDataError("There is no category with such id in database")
+        try:
+            (cat_touched, exp_touched) = self._del_cat(
+                cat.id,
+                children_policy=children_policy,
+                expense_handling=expense_handling,
+                parent_id=rows[0],
+            )
+        except Exception:
+            # Cache may be partially updated
+            self.invalidate_cache()
+            raise
+        if exp_touched:
+            # Touched expenses are not collected one by one, recompute instead
+            self.model.budget_model.update_spent_budget()
         cat.id = None  # Corrupt PonyCategory object for safety
         cat.name = "DELETED"
         return (cat_touched, exp_touched)
@@ -85,61 +192,79 @@ class PonyCategoryModel(AbstractCategoryModel):
     @db_session
     def _del_cat(
         self,
-        cat_to_del: Self.db.Category,
+        cat_id: int,
         children_policy: CategoryDeletePolicy = CategoryDeletePolicy.delete,
         expense_handling: ExpensesHandlingPolicy = ExpensesHandlingPolicy.delete,
-        parent_for_exps: typing.Optinal[Self.db.Category] = None,
+        parent_id: typing.Optional[int] = None,
     ) -> tuple[int, int]:
-        cat_touched = 0
-        exp_touched = 0
-        if parent_for_exps is None:
-            expense_handling = ExpensesHandlingPolicy.delete
+        """
+        Deletes category (with its subtree or moving children to parent_id)
+        by a few set-based statements. Expenses of deleted categories are
+        deleted or moved to parent_id (deleted if there is no parent).
+        """
         if children_policy == CategoryDeletePolicy.delete:
-            for child in cat_to_del.children:
-                (n1, n2) = self._del_cat(
-                    child,
-                    children_policy=children_policy,
-                    expense_handling=expense_handling,
-                    parent_for_exps=parent_for_exps,
+            # The deepest categories go first, so cache never gets orphans
+            ids = self.db.select(
+                'SELECT "descendant" FROM "CategoryClosure" WHERE "ancestor" = $id '
+                'ORDER BY "depth" DESC',
+                {"id": cat_id},
+            )
+            cat_touched = 0
+        else:
+            ids = [cat_id]
+            cursor = self.db.execute(
+                'UPDATE "Category" SET "parent" = $parent WHERE "parent" = $id',
+                {"parent": parent_id, "id": cat_id},
+            )
+            cat_touched = cursor.rowcount
+            if self._tree is not None:
+                for child in list(self._tree.children.get(cat_id, [])):
+                    self._move_cached(child, parent_id)
+        if parent_id is None:
+            expense_handling = ExpensesHandlingPolicy.delete
+        exp_touched = 0
+        for chunk in chunked(ids, SQLITE_MAX_VARIABLES - 1):
+            placeholders, params = sql_list_params("id", chunk)
+            if expense_handling == ExpensesHandlingPolicy.delete:
+                sql = f'DELETE FROM "Expense" WHERE "category" IN ({placeholders})'
+            else:
+                params["parent"] = parent_id
+                sql = (
+                    'UPDATE "Expense" SET "category" = $parent '
+                    f'WHERE "category" IN ({placeholders})'
                 )
-                cat_touched += n1
-                exp_touched += n2
-        if children_policy == CategoryDeletePolicy.move:
-            parent = cat_to_del.parent
-            for child in cat_to_del.children:
-                child.parent = parent
-                cat_touched += 1
-
-        if expense_handling == ExpensesHandlingPolicy.delete:
-            for exp in self.db.Expense.select(lambda e: e.category == cat_to_del):
-                exp.delete()
-                exp_touched += 1
-        if expense_handling == ExpensesHandlingPolicy.move:
-            for exp in self.db.Expense.select(lambda e: e.category == cat_to_del):
-                exp.category = parent_for_exps
-                exp_touched += 1
-        cat_to_del.delete()
-        return (cat_touched + 1, exp_touched)
+            exp_touched += self.db.execute(sql, params).rowcount
+            cursor = self.db.execute(
+                f'DELETE FROM "Category" WHERE "id" IN ({placeholders})', params
+            )
+            cat_touched += cursor.rowcount
+        for id in ids:
+            self._remove_cached(id)
+        return (cat_touched, exp_touched)
 
-    @db_session
     def get_parent(self, category: PonyCategory) -> typing.Optional[PonyCategory]:
-        parent_category = self.db.Category[category.id].parent
-        if parent_category is None:
+        tree = self._get_tree()
+        self._check_cached(tree, category.id)
+        parent_id = tree.parents[category.id]
+        if parent_id is None:
             return None
-        return self._form_ponycat(parent_category)
+        return self._form_cached_ponycat(tree, parent_id)
 
-    @db_session
     def get_children(self, category: PonyCategory) -> list[PonyCategory]:
-        children = []
-        for child in self.db.Category[category.id].children:
-            children.append(PonyCategory(model=self, id=child.id, name=child.name))
-        return children
+        tree = self._get_tree()
+        self._check_cached(tree, category.id)
+        return [
+            self._form_cached_ponycat(tree, child)
+            for child in tree.children.get(category.id, [])
+        ]
 
     @db_session
     def rename_category(self, cat: PonyCategory, new_name: str) -> PonyCategory:
         cat_to_rename = self.db.Category[cat.id]
         cat_to_rename.name = new_name
         cat_to_rename.flush()
+        if self._tree is not None:
+            self._tree.names[cat.id] = new_name
         cat.name = new_name
         return cat
 
@@ -150,56 +275,100 @@ class PonyCategoryModel(AbstractCategoryModel):
         cat_to_upd = self.db.Category[cat.id]
         if CategoryField.parent in upd_data:
             if upd_data[CategoryField.parent] is not None:
+                if self._is_descendant(upd_data[CategoryField.parent], cat.id):
+                    raise CategoryCycleError(
+                        "Category can not be moved into its own subtree"
+                    )
                 upd_data[CategoryField.parent] = self.db.Category[
                     upd_data[CategoryField.parent]
                 ]
         cat_to_upd.set(**upd_data)
         cat_to_upd.flush()
+        if self._tree is not None:
+            self._tree.names[cat_to_upd.id] = cat_to_upd.name
+            parent_id = None if cat_to_upd.parent is None else cat_to_upd.parent.id
+            if self._tree.parents[cat_to_upd.id] != parent_id:
+                self._move_cached(cat_to_upd.id, parent_id)
         return self._form_ponycat(cat_to_upd)
 
-    @db_session
     def get_categories_by_ids(self, ids: list[int]) -> list[PonyCategory]:
-        result = []
-        fail = False
-        for id in ids:
-            try:
-                loaded_cat = self.db.Category[id]
-                result.append(self._form_ponycat(loaded_cat))
-            except ObjectNotFound:
-                fail = True
-        if fail:
+        tree = self._get_tree()
+        result = [self._form_cached_ponycat(tree, id) for id in ids if id in tree.names]
+        if len(result) != len(ids):
             raise NoDataError(
                 ("There is no categories in database for one " "or more ids provided"),
                 result,
             )
         return result
 
-    @db_session
     def get_root_categories(self) -> list[PonyCategory]:
-        root_cats = self.db.Category.select(lambda c: c.parent is None)
-        result = [self._form_ponycat(rcat) for rcat in root_cats]
-        return result
+        tree = self._get_tree()
+        return [self._form_cached_ponycat(tree, id) for id in tree.children[None]]
 
-    @db_session
     def get_whole_subtree(
         self, category: typing.Optional[PonyCategory] = None
     ) -> list[PonyCategory]:
+        """
+        Returns category with all its descendants (or all categories if None)
+        in depth-first order. The tree is loaded by one query
+        and then served from memory.
+        """
+        tree = self._get_tree()
+        if category is not None:
+            self._check_cached(tree, category.id)
+        return [
+            self._form_cached_ponycat(tree, id)
+            for id in tree.subtree(None if category is None else category.id)
+        ]
 
-        result: list[PonyCategory] = []
-        if category is None:
-            root_cats = self.get_root_categories()
-            for root_cat in root_cats:
-                result.extend(self.get_whole_subtree(root_cat))
-        else:
-            result.append(category)
-            for child in category.get_children():
-                result.extend(self.get_whole_subtree(child))
-        return result
-
-    @db_session
     def get_all_categories(self) -> list[PonyCategory]:
         return self.get_whole_subtree()
 
+    @db_session
+    def get_ancestors(self, category: PonyCategory) -> list[PonyCategory]:
+        ids = self.db.select(
+            'SELECT "ancestor" FROM "CategoryClosure" '
+            'WHERE "descendant" = $id AND "depth" > 0 ORDER BY "depth"',
+            {"id": category.id},
+        )
+        return self.get_categories_by_ids(ids)
+
+    def is_in_subtree(self, category: PonyCategory, ancestor: PonyCategory) -> bool:
+        return self._is_descendant(category.id, ancestor.id)
+
+    @db_session
+    def _is_descendant(self, id: int, ancestor_id: int) -> bool:
+        return bool(
+            self.db.select(
+                'SELECT count(*) FROM "CategoryClosure" '
+                'WHERE "ancestor" = $ancestor AND "descendant" = $id',
+                {"ancestor": ancestor_id, "id": id},
+            )[0]
+        )
+
+    def _move_cached(self, id: int, parent: typing.Optional[int]) -> None:
+        if self._tree is not None:
+            self._tree.move(id, parent)
+
+    def _remove_cached(self, id: int) -> None:
+        if self._tree is not None:
+            self._tree.remove(id)
+
+    @staticmethod
+    def _check_cached(tree: _CategoryTree, id: int) -> None:
+        if id not in tree.names:
+            raise NoDataError("There is no category with such id in database")
+
+    def _form_cached_ponycat(self, tree: _CategoryTree, id: int) -> PonyCategory:
+        return PonyCategory(
+            model=self, id=id, name=tree.names[id], parent_id=tree.parents[id]
+        )
+
     @db_session
     def _form_ponycat(self, cat: Self.db.Category) -> PonyCategory:
-        return PonyCategory(model=self, id=cat.id, name=cat.name)
+        return PonyCategory(
+            model=self,
+            id=cat.id,
+            name=cat.name,
+            parent_id=None if cat.parent is None else cat.parent.id,
+        )
@@ -1,9 +1,14 @@
 from __future__ import annotations
-from pony.orm import db_session, Database, ObjectNotFound, select, desc
+from pony.orm import db_session, Database, IntegrityError
+from pony.utils import datetime2timestamp, timestamp2datetime
+from collections import defaultdict
+import base64
+import binascii
+import sqlite3
 import typing
 from typing_extensions import Self
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import date, datetime, time, timedelta
 
 from bookkeeper.models.abstract_expense_model import (
     AbstractExpense,
@@ -12,8 +17,16 @@ from bookkeeper.models.abstract_expense_model import (
     ExpenseConstraint,
     ConstraintType,
     ExpenseField,
+    ExpenseRecord,
+    ExpensesPage,
+    SeriesBucket,
 )
 from bookkeeper.models.abstract_model import AbstractModel
+from bookkeeper.models.pony_models.pony_utils import (
+    SQLITE_MAX_VARIABLES,
+    chunked,
+    sql_list_params,
+)
 from bookkeeper.exceptions import (
     PrimaryKeyAssignmentError,
     ConstraintError,
@@ -33,6 +46,45 @@ class PonyExpense(AbstractExpense):
 
 
 class PonyExpensesModel(AbstractExpensesModel):
+    _INSERT_COLUMNS: tuple[str, ...] = (
+        "amount",
+        "category",
+        "expense_date",
+        "added_date",
+        "comment",
+    )
+    # Columns of expense together with its category, see _form_ponyexpense_from_row
+    _SELECT_COLUMNS: str = (
+        '"e"."id", "e"."amount", "e"."expense_date", "e"."added_date", "e"."comment", '
+        '"c"."id" AS "category_id", "c"."name" AS "category_name", '
+        '"c"."label" AS "category_label"'
+    )
+    _CATEGORY_JOIN: str = 'JOIN "Category" "c" ON "c"."id" = "e"."category"'
+    _BUCKET_SQL_KEYS: dict[SeriesBucket, str] = {
+        SeriesBucket.day: "strftime('%Y-%m-%d', \"expense_date\")",
+        # Monday of the week: move to the next sunday (if not yet) and back 6 days
+        SeriesBucket.week: (
+            "strftime('%Y-%m-%d', \"expense_date\", 'weekday 0', '-6 days')"
+        ),
+        SeriesBucket.month: "strftime('%Y-%m', \"expense_date\")",
+    }
+    # Ids of category with given id and all its descendants
+    _SUBTREE_SQL: str = (
+        'SELECT "descendant" FROM "CategoryClosure" WHERE "ancestor" = $%s'
+    )
+    # Ids of expenses with comments matching FTS5 query
+    _FTS_SQL: str = (
+        'SELECT "rowid" FROM "ExpenseCommentFTS" WHERE "ExpenseCommentFTS" MATCH $%s'
+    )
+    _SQL_OPERATORS: dict[ConstraintType, str] = {
+        ConstraintType.less: "<",
+        ConstraintType.leq: "<=",
+        ConstraintType.equal: "=",
+        ConstraintType.neq: "!=",
+        ConstraintType.geq: ">=",
+        ConstraintType.greater: ">",
+    }
+
     def __init__(self, model: AbstractModel, database: Database):
         self.model = model
         self.db = database
@@ -55,6 +107,7 @@ class PonyExpensesModel(AbstractExpensesModel):
             amount=amount, category=self.db.Category[category.id], **kwargs
         )
         new_expense.flush()
+        self._apply_spent_deltas([(new_expense.expense_date, new_expense.amount)])
         # return PonyExpense(model=self,
         #                    id=new_expense.id,
         #                    amount=amount,
@@ -64,11 +117,84 @@ class PonyExpensesModel(AbstractExpensesModel):
         #                    comment=new_expense.comment)
         return self._form_ponyexpense(new_expense)
 
+    @db_session
+    def add_expenses(
+        self, records: list[ExpenseRecord], build_expenses: bool = True
+    ) -> list[PonyExpense] | list[int]:
+        """
+        Inserts records with multi-row INSERT statements in one transaction,
+        bypassing creation of Pony entities. If build_expenses is False only
+        ids of added expenses are returned.
+        """
+        now = datetime.now()
+        rows = [
+            (
+                float(rec.amount),
+                rec.category.id,
+                rec.expense_date if rec.expense_date is not None else now,
+                now,
+                rec.comment if rec.comment is not None else "",
+            )
+            for rec in records
+        ]
+        columns = ", ".join(f'"{col}"' for col in self._INSERT_COLUMNS)
+        placeholders = "(" + ", ".join("?" * len(self._INSERT_COLUMNS)) + ")"
+        self.db.flush()
+        cursor = self.db.get_connection().cursor()
+        ids: list[int] = []
+        for chunk in chunked(rows, SQLITE_MAX_VARIABLES // len(self._INSERT_COLUMNS)):
+            params = []
+            for amount, cat_id, exp_date, add_date, comment in chunk:
+                params.extend(
+                    (
+                        amount,
+                        cat_id,
+                        datetime2timestamp(exp_date),
+                        datetime2timestamp(add_date),
+                        comment,
+                    )
+                )
+            try:
+                cursor.execute(
+                    f'INSERT INTO "Expense" ({columns}) VALUES '
+                    + ", ".join([placeholders] * len(chunk)),
+                    params,
+                )
+            except sqlite3.IntegrityError:
+                raise NoDataError(
+                    "There is no categories in database for one or more records"
+                )
+            # AUTOINCREMENT keys of one statement inside a write transaction
+            # are consecutive, so the whole chunk ends with lastrowid
+            ids.extend(range(cursor.lastrowid - len(chunk) + 1, cursor.lastrowid + 1))
+        self._apply_spent_deltas([(exp_date, amount) for amount, _, exp_date, *_ in rows])
+        if not build_expenses:
+            return ids
+        labels = self._select_category_labels([rec.category.id for rec in records])
+        return [
+            PonyExpense(
+                model=self,
+                id=id,
+                amount=amount,
+                expense_date=exp_date,
+                added_date=add_date,
+                comment=comment,
+                category_id=rec.category.id,
+                category_name=rec.category.name,
+                category_label=labels[rec.category.id],
+            )
+            for id, (amount, _, exp_date, add_date, comment), rec in zip(
+                ids, rows, records
+            )
+        ]
+
     @db_session
     def delete_expense(self, expense: PonyExpense) -> None:
         expense_to_delete = self.db.Expense[expense.id]
+        delta = (expense_to_delete.expense_date, -expense_to_delete.amount)
         expense_to_delete.delete()
         expense_to_delete.flush()
+        self._apply_spent_deltas([delta])
         # Corrupt deleted object
         expense.id = None
         # expense.category = None
@@ -76,26 +202,85 @@ class PonyExpensesModel(AbstractExpensesModel):
 
     @db_session
     def delete_expenses(self, expenses: list[PonyExpense]) -> None:
+        self.delete_expenses_by_ids([expense.id for expense in expenses])
         for expense in expenses:
-            self.db.Expense[expense.id].delete()
             # Corrupt deleted object
             expense.id = None
             # expense.category = None
             expense.comment = "DELETED"
 
     @db_session
-    def get_expenses_by_ids(self, ids: list[int]) -> list[PonyExpense]:
-        result = []
-        fail = False
-        for id in ids:
+    def delete_expenses_by_ids(self, ids: list[int]) -> int:
+        deleted = 0
+        deltas = []
+        for chunk in chunked(list(dict.fromkeys(ids)), SQLITE_MAX_VARIABLES):
+            placeholders, params = sql_list_params("id", chunk)
+            deltas.extend(
+                (expense_date, -amount)
+                for _, expense_date, amount in self._select_amounts(placeholders, params)
+            )
+            cursor = self.db.execute(
+                f'DELETE FROM "Expense" WHERE "id" IN ({placeholders})', params
+            )
+            deleted += cursor.rowcount
+        self._apply_spent_deltas(deltas)
+        return deleted
+
+    @db_session
+    def update_expenses(
+        self, ids: list[int], attr_dict: dict[ExpenseField, typing.Any]
+    ) -> int:
+        if "id" in attr_dict.keys():
+            raise (
+                PrimaryKeyAssignmentError(
+                    'Attribute "id" of PonyExpense object can not be reassigned.'
+                )
+            )
+        if not attr_dict:
+            return 0
+        values: dict[str, typing.Any] = {}
+        for key, value in attr_dict.items():
+            field = ExpenseField(key)
+            if field == ExpenseField.category:
+                value = value.id
+            elif field in (ExpenseField.expense_date, ExpenseField.added_date):
+                value = datetime2timestamp(value)
+            elif field == ExpenseField.amount:
+                value = float(value)
+            values[f"v_{field.value}"] = value
+        assignments = ", ".join(f'"{name[2:]}" = ${name}' for name in values)
+        new_amount = values.get("v_amount")
+        new_date = attr_dict.get(ExpenseField.expense_date)
+        updated = 0
+        deltas = []
+        for chunk in chunked(list(dict.fromkeys(ids)), SQLITE_MAX_VARIABLES // 2):
+            placeholders, params = sql_list_params("id", chunk)
+            deltas.extend(self._update_deltas(placeholders, params, new_date, new_amount))
+            params.update(values)
             try:
-                loaded_exp = self.db.Expense[id]
-                # atrs = loaded_exp.to_dict(exclude="category")
-                # result.append(PonyExpense(model=self, **atrs))
-                result.append(self._form_ponyexpense(loaded_exp))
-            except ObjectNotFound:
-                fail = True
-        if fail:
+                cursor = self.db.execute(
+                    f'UPDATE "Expense" SET {assignments} WHERE "id" IN ({placeholders})',
+                    params,
+                )
+            except IntegrityError:
+                raise NoDataError("There is no category in database with id provided")
+            updated += cursor.rowcount
+        self._apply_spent_deltas(deltas)
+        return updated
+
+    @db_session
+    def get_expenses_by_ids(self, ids: list[int]) -> list[PonyExpense]:
+        loaded = {}
+        for chunk in chunked(list(dict.fromkeys(ids)), SQLITE_MAX_VARIABLES):
+            placeholders, params = sql_list_params("id", chunk)
+            for row in self.db.select(
+                f'SELECT {self._SELECT_COLUMNS} FROM "Expense" "e" {self._CATEGORY_JOIN} '
+                f'WHERE "e"."id" IN ({placeholders})',
+                params,
+            ):
+                loaded[row.id] = self._form_ponyexpense_from_row(row)
+        result = [loaded[id] for id in ids if id in loaded]
+        if len(result) != len(ids):
             raise NoDataError(
                 "There is no expenses in database for one \
                               or more ids provided",
@@ -107,57 +292,190 @@ class PonyExpensesModel(AbstractExpensesModel):
     def get_expenses_by_constraints(
         self, constraints: list[ExpenseConstraint], max_num: typing.Optional[int] = None
     ) -> list[PonyExpense]:
+        sql, params = self._form_select_sql(constraints, max_num)
+        rows = self.db.select(sql, params)
+        return [self._form_ponyexpense_from_row(row) for row in rows]
+
+    def iter_expenses_by_constraints(
+        self, constraints: list[ExpenseConstraint], chunk_size: int = 500
+    ) -> typing.Iterator[PonyExpense]:
+        """
+        Lazily yields expenses satisfying constraints in the order of
+        get_expenses_by_constraints. Rows are fetched by chunks of chunk_size,
+        each in its own db_session, so memory use does not depend on table size.
+        """
+        # Fail early on invalid arguments, not on the first next() call
+        if chunk_size < 1:
+            raise ValueError(f"Chunk size should be positive, got {chunk_size}")
+        self._compile_constraints(constraints)
+        return self._iter_expense_chunks(constraints, chunk_size)
+
+    def _iter_expense_chunks(
+        self, constraints: list[ExpenseConstraint], chunk_size: int
+    ) -> typing.Iterator[PonyExpense]:
+        after = None
+        while True:
+            with db_session:
+                sql, params = self._form_select_sql(constraints, chunk_size, after)
+                rows = self.db.select(sql, params)
+            for row in rows:
+                yield self._form_ponyexpense_from_row(row)
+            if len(rows) < chunk_size:
+                return
+            after = (timestamp2datetime(rows[-1].expense_date), rows[-1].id)
+
+    @db_session
+    def get_expenses_page(
+        self,
+        constraints: list[ExpenseConstraint],
+        page_size: int,
+        cursor: typing.Optional[str] = None,
+    ) -> ExpensesPage:
+        if page_size < 1:
+            raise ValueError(f"Page size should be positive, got {page_size}")
+        after = None if cursor is None else self._decode_cursor(cursor)
+        sql, params = self._form_select_sql(constraints, page_size + 1, after)
+        rows = self.db.select(sql, params)
+        result = [self._form_ponyexpense_from_row(row) for row in rows[:page_size]]
+        next_cursor = None
+        if len(rows) > page_size:
+            last = result[-1]
+            next_cursor = self._encode_cursor(last.expense_date, last.id)
+        return ExpensesPage(expenses=result, next_cursor=next_cursor)
+
+    @staticmethod
+    def _encode_cursor(expense_date: datetime, id: int) -> str:
+        key = f"{datetime2timestamp(expense_date)}|{id}"
+        return base64.urlsafe_b64encode(key.encode()).decode()
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+        try:
+            key = base64.urlsafe_b64decode(cursor.encode()).decode()
+            timestamp, id = key.split("|")
+            return (timestamp2datetime(timestamp), int(id))
+        except (ValueError, binascii.Error):
+            raise ValueError(f"Invalid expenses page cursor: {cursor!r}")
+
+    def _form_select_sql(
+        self,
+        constraints: list[ExpenseConstraint],
+        max_num: typing.Optional[int] = None,
+        after: typing.Optional[tuple[datetime, int]] = None,
+    ) -> tuple[str, dict[str, typing.Any]]:
+        """
+        Forms query for expenses ordered by (expense_date, id) descending.
+        If after is provided, only expenses following that key are selected,
+        so the query seeks through the expense_date index instead of skipping rows
+        """
+        where, params = self._compile_constraints(constraints)
+        if after is not None:
+            params["after_date"] = datetime2timestamp(after[0])
+            params["after_id"] = after[1]
+            where += (
+                ' AND "e"."expense_date" <= $after_date AND'
+                ' ("e"."expense_date" < $after_date OR "e"."id" < $after_id)'
+            )
+        # TODO : Add possibility for result sorting in abstract model
+        sql = (
+            f'SELECT {self._SELECT_COLUMNS} FROM "Expense" "e" {self._CATEGORY_JOIN} '
+            f'WHERE {where} ORDER BY "e"."expense_date" DESC, "e"."id" DESC'
+        )
+        if max_num is not None and max_num >= 0:
+            sql += f" LIMIT {int(max_num)}"
+        return sql, params
+
+    def _compile_constraints(
+        self, constraints: list[ExpenseConstraint]
+    ) -> tuple[str, dict[str, typing.Any]]:
+        """
+        Translates constraints into SQL condition on "Expense" table aliased as "e".
+        Returns condition and its parameters (referenced as $name in Pony raw SQL)
+        """
         for c in constraints:
             if not self._validate_constraint(c):
                 raise (ConstraintError("Invalid constraint provided"))
 
-        query = self.db.Expense.select()
-        for c in constraints:
-            if c.expense_field == ExpenseField.category:
-                cat_to_cmp = self.db.Category[c.expression.id]
-                query = query.where(lambda e: e.category == cat_to_cmp)
-            elif c.expense_field == ExpenseField.comment:
-                query = query.where(lambda e: e.comment == c.expression)
+        predicates = []
+        params: dict[str, typing.Any] = {}
+        for i, c in enumerate(constraints):
+            field = ExpenseField(c.expense_field)
+            param = f"c{i}"
+            if field == ExpenseField.category:
+                params[param] = c.expression.id
+            elif field in (ExpenseField.expense_date, ExpenseField.added_date):
+                params[param] = datetime2timestamp(c.expression)
             else:
-
-                def check(f, expr, lfl, eqfl, gfl):
-                    return (
-                        (f < expr and lfl) or (f == expr and eqfl) or (f > expr and gfl)
-                    )
-
-                flags = [
-                    bool(c.constraint_type & ConstraintType.less),
-                    bool(c.constraint_type & ConstraintType.equal),
-                    bool(c.constraint_type & ConstraintType.greater),
-                ]
-                query = query.where(
-                    lambda e: check(
-                        getattr(e, c.expense_field),
-                        c.expression,
-                        flags[0],
-                        flags[1],
-                        flags[2],
-                    )
+                params[param] = c.expression
+            operator = self._SQL_OPERATORS.get(c.constraint_type)
+            if c.constraint_type == ConstraintType.in_subtree:
+                predicates.append(f'"e"."category" IN ({self._SUBTREE_SQL % param})')
+            elif c.constraint_type in (ConstraintType.match, ConstraintType.prefix):
+                params[param] = self._form_fts_query(
+                    c.expression, c.constraint_type == ConstraintType.prefix
                 )
-        # TODO : Add possibility for result sorting in abstract model
-        query = query.order_by(lambda e: desc(e.expense_date))
-
-        if max_num is None or max_num < 0:
-            expenses_got = query[:]
-        else:
-            expenses_got = query[:max_num]
-        result = []
-        for exps in expenses_got:
-            result.append(self._form_ponyexpense(exps))
-        return result
+                predicates.append(f'"e"."id" IN ({self._FTS_SQL % param})')
+            elif operator is None:
+                # Either none or all of less/equal/greater flags are set
+                predicates.append("1" if c.constraint_type else "0")
+            else:
+                predicates.append(f'"e"."{field.value}" {operator} ${param}')
+        if not predicates:
+            return "1", params
+        return " AND ".join(predicates), params
 
     def _validate_constraint(self, constraint: ExpenseConstraint) -> bool:
-        if constraint.constraint_type != ConstraintType.equal and (
-            constraint.expense_field == ExpenseField.category
-            or constraint.expense_field == ExpenseField.comment
-        ):
+        try:
+            ExpenseField(constraint.expense_field)
+        except ValueError:
             return False
-        return True
+        if constraint.expense_field == ExpenseField.category:
+            return constraint.constraint_type in (
+                ConstraintType.equal,
+                ConstraintType.in_subtree,
+            )
+        if constraint.expense_field == ExpenseField.comment:
+            return constraint.constraint_type in (
+                ConstraintType.equal,
+                ConstraintType.match,
+                ConstraintType.prefix,
+            )
+        return not constraint.constraint_type & (
+            ConstraintType.in_subtree | ConstraintType.match | ConstraintType.prefix
+        )
+
+    @staticmethod
+    def _form_fts_query(text: str, prefix: bool) -> str:
+        """
+        Forms FTS5 query matching all words of text (or words starting with them).
+        Words are quoted, so FTS5 operators in text are taken literally.
+        """
+        suffix = "*" if prefix else ""
+        words = ['"' + word.replace('"', '""') + '"' + suffix for word in text.split()]
+        # Empty query is a syntax error in FTS5, so match an impossible word instead
+        return " ".join(words) if words else '""'
+
+    @db_session
+    def search_expenses(
+        self,
+        text: str,
+        constraints: typing.Optional[list[ExpenseConstraint]] = None,
+        max_num: typing.Optional[int] = None,
+        prefix: bool = False,
+    ) -> list[PonyExpense]:
+        where, params = self._compile_constraints(constraints or [])
+        params["fts_query"] = self._form_fts_query(text, prefix)
+        sql = (
+            f'SELECT {self._SELECT_COLUMNS} FROM "ExpenseCommentFTS" '
+            'JOIN "Expense" "e" ON "e"."id" = "ExpenseCommentFTS"."rowid" '
+            f"{self._CATEGORY_JOIN} "
+            f'WHERE "ExpenseCommentFTS" MATCH $fts_query AND {where} '
+            'ORDER BY "ExpenseCommentFTS"."rank", "e"."expense_date" DESC'
+        )
+        if max_num is not None and max_num >= 0:
+            sql += f" LIMIT {int(max_num)}"
+        rows = self.db.select(sql, params)
+        return [self._form_ponyexpense_from_row(row) for row in rows]
 
     @db_session
     def set_attributes(
@@ -177,9 +495,17 @@ class PonyExpensesModel(AbstractExpensesModel):
                 attr_dict[ExpenseField.category].id
             ]
             del new_attrs[ExpenseField.category]
+            expense.category_id = attr_dict[ExpenseField.category].id
+            expense.category_name = attr_dict[ExpenseField.category].name
+            expense.category_label = attr_dict[ExpenseField.category].label
         expense_to_modify = self.db.Expense[expense.id]
+        old_delta = (expense_to_modify.expense_date, -expense_to_modify.amount)
         expense_to_modify.set(**attr_dict)
         expense_to_modify.flush()
+        if ExpenseField.amount in attr_dict or ExpenseField.expense_date in attr_dict:
+            self._apply_spent_deltas(
+                [old_delta, (expense_to_modify.expense_date, expense_to_modify.amount)]
+            )
         for key in new_attrs:
             setattr(expense, key, new_attrs[key])
 
@@ -191,16 +517,303 @@ class PonyExpensesModel(AbstractExpensesModel):
 
     @db_session
     def get_expense_amount_by_time_period(self, start: datetime, end: datetime) -> float:
-        result = select(
-            sum(exp.amount) for exp in self.db.Expense
-            if exp.expense_date >= start and exp.expense_date <= end
-        ).first()
-        if result is None:
-            return 0
-        return result
+        return self.get_expense_amounts_by_time_periods([(start, end)])[0]
+
+    @db_session
+    def get_expense_amounts_by_time_periods(
+        self, periods: list[tuple[datetime, datetime]]
+    ) -> list[float]:
+        if not periods:
+            return []
+        (result,) = self.db.select(*self._form_periods_sum_sql(periods))
+        if len(periods) == 1:
+            # Pony returns single column values as they are, not as rows
+            result = (result,)
+        return [float(amount) for amount in result]
+
+    def _form_periods_sum_sql(
+        self, periods: list[tuple[datetime, datetime]]
+    ) -> tuple[str, dict[str, typing.Any]]:
+        """
+        Forms one query with a column of sum for each period. Every sum is
+        a separate scalar subquery reading only its own range by index,
+        not a SUM(CASE ...) over rows of the widest period.
+        """
+        params: dict[str, typing.Any] = {}
+        sums = []
+        for i, (start, end) in enumerate(periods):
+            source, source_params = self._period_source_sql(start, end, f"p{i}_")
+            params.update(source_params)
+            sums.append(f'(SELECT coalesce(SUM("amount"), 0) FROM ({source}))')
+        return f'SELECT {", ".join(sums)}', params
+
+    @db_session
+    def get_expense_totals_by_category(
+        self, start: datetime, end: datetime, rollup: bool = False
+    ) -> dict[int, float]:
+        source, params = self._period_source_sql(start, end)
+        totals: dict[int, float] = dict(
+            self.db.select(
+                f'SELECT "category", SUM("amount") FROM ({source}) GROUP BY "category"',
+                params,
+            )
+        )
+        if not rollup:
+            return totals
+        subtree_totals = self._rollup_totals(
+            {cat_id: [amount] for cat_id, amount in totals.items()}, 1
+        )
+        return {cat_id: amounts[0] for cat_id, amounts in subtree_totals.items()}
+
+    @db_session
+    def get_expense_totals_by_category_for_days(
+        self, periods: list[tuple[date, date]], rollup: bool = False
+    ) -> dict[int, list[float]]:
+        if not periods:
+            return {}
+        params: dict[str, typing.Any] = {
+            "first_day": min(first for first, _ in periods).isoformat(),
+            "last_day": max(last for _, last in periods).isoformat(),
+        }
+        sums = []
+        for i, (first, last) in enumerate(periods):
+            params[f"first{i}"] = first.isoformat()
+            params[f"last{i}"] = last.isoformat()
+            sums.append(
+                f'SUM(CASE WHEN "date" >= $first{i} AND "date" <= $last{i} '
+                'THEN "amount" ELSE 0 END)'
+            )
+        rows = self.db.select(
+            f'SELECT "category", {", ".join(sums)} FROM "DailyTotal" '
+            'WHERE "date" >= $first_day AND "date" <= $last_day GROUP BY "category"',
+            params,
+        )
+        totals = {row[0]: list(row[1:]) for row in rows}
+        if not rollup:
+            return totals
+        return self._rollup_totals(totals, len(periods))
+
+    def _rollup_totals(
+        self, totals: dict[int, list[float]], width: int
+    ) -> dict[int, list[float]]:
+        """
+        Sums up totals of every category with totals of its subcategories.
+        Every category is present in result, with zeros if there is no expenses.
+        """
+        parents: dict[int, typing.Optional[int]] = dict(
+            self.db.select('SELECT "id", "parent" FROM "Category"')
+        )
+        children = defaultdict(list)
+        for cat_id, parent_id in parents.items():
+            children[parent_id].append(cat_id)
+        preorder = []
+        stack = list(children[None])
+        while stack:
+            cat_id = stack.pop()
+            preorder.append(cat_id)
+            stack.extend(children[cat_id])
+        subtree_totals = {
+            cat_id: list(totals.get(cat_id, [0.0] * width)) for cat_id in parents
+        }
+        # Children go after their parents in preorder, so reversed order
+        # adds every subtree total to the parent only after it is complete
+        for cat_id in reversed(preorder):
+            parent_id = parents[cat_id]
+            if parent_id is not None:
+                parent_totals = subtree_totals[parent_id]
+                for i, amount in enumerate(subtree_totals[cat_id]):
+                    parent_totals[i] += amount
+        return subtree_totals
+
+    @db_session
+    def get_expense_series(
+        self,
+        start: datetime,
+        end: datetime,
+        bucket: SeriesBucket = SeriesBucket.day,
+        category: typing.Optional[AbstractCategory] = None,
+    ) -> list[float]:
+        bucket = SeriesBucket(bucket)
+        source, params = self._period_source_sql(
+            start, end, category=None if category is None else category.id
+        )
+        sums = dict(
+            self.db.select(
+                f"SELECT {self._BUCKET_SQL_KEYS[bucket]}, SUM(\"amount\") "
+                f"FROM ({source}) GROUP BY 1",
+                params,
+            )
+        )
+        return [sums.get(key, 0.0) for key in self._bucket_keys(start, end, bucket)]
+
+    @staticmethod
+    def _bucket_keys(start: datetime, end: datetime, bucket: SeriesBucket) -> list[str]:
+        """
+        Keys of all buckets between start and end in format of _BUCKET_SQL_KEYS
+        """
+        if bucket == SeriesBucket.month:
+            months = (end.year - start.year) * 12 + end.month - start.month + 1
+            return [
+                f"{start.year + (start.month - 1 + i) // 12:04d}-"
+                f"{(start.month - 1 + i) % 12 + 1:02d}"
+                for i in range(months)
+            ]
+        first_day = start.date()
+        step = 1
+        if bucket == SeriesBucket.week:
+            first_day -= timedelta(days=first_day.weekday())
+            step = 7
+        days = (end.date() - first_day).days
+        return [
+            (first_day + timedelta(days=i)).isoformat() for i in range(0, days + 1, step)
+        ]
 
     # Utility functions
+    @staticmethod
+    def _period_source_sql(
+        start: datetime,
+        end: datetime,
+        prefix: str = "",
+        category: typing.Optional[int] = None,
+    ) -> tuple[str, dict[str, typing.Any]]:
+        """
+        Forms subquery with "expense_date", "category" and "amount" columns, which
+        amounts sum up to the expenses within time range. Days fully covered by
+        the range are read from DailyTotal (one row per category), and only
+        expenses of partially covered first and last days are read one by one.
+        Returns subquery and its parameters, which names start with prefix.
+        """
+        first_day = start.date()
+        if start.time() != time.min:
+            first_day += timedelta(days=1)
+        last_day = end.date()
+        if end.time() != time.max:
+            last_day -= timedelta(days=1)
+        where = ""
+        params: dict[str, typing.Any] = {}
+        if category is not None:
+            where = f' AND "category" = ${prefix}category'
+            params[f"{prefix}category"] = category
+        if first_day > last_day:
+            params[f"{prefix}start"] = datetime2timestamp(start)
+            params[f"{prefix}end"] = datetime2timestamp(end)
+            return (
+                'SELECT "expense_date", "category", "amount" FROM "Expense" '
+                f'WHERE "expense_date" >= ${prefix}start '
+                f'AND "expense_date" <= ${prefix}end{where}',
+                params,
+            )
+        params.update(
+            {
+                f"{prefix}start": datetime2timestamp(start),
+                f"{prefix}first_start": datetime2timestamp(
+                    datetime.combine(first_day, time.min)
+                ),
+                f"{prefix}last_end": datetime2timestamp(
+                    datetime.combine(last_day, time.max)
+                ),
+                f"{prefix}end": datetime2timestamp(end),
+                f"{prefix}first_day": first_day.isoformat(),
+                f"{prefix}last_day": last_day.isoformat(),
+            }
+        )
+        return (
+            'SELECT "date" AS "expense_date", "category", "amount" FROM "DailyTotal" '
+            f'WHERE "date" >= ${prefix}first_day AND "date" <= ${prefix}last_day{where} '
+            'UNION ALL '
+            'SELECT "expense_date", "category", "amount" FROM "Expense" '
+            f'WHERE "expense_date" >= ${prefix}start '
+            f'AND "expense_date" < ${prefix}first_start{where} '
+            'UNION ALL '
+            'SELECT "expense_date", "category", "amount" FROM "Expense" '
+            f'WHERE "expense_date" > ${prefix}last_end '
+            f'AND "expense_date" <= ${prefix}end{where}',
+            params,
+        )
+
+    def _select_amounts(
+        self, placeholders: str, params: dict[str, typing.Any]
+    ) -> list[tuple[int, datetime, float]]:
+        """
+        Returns (id, expense_date, amount) of expenses with ids from IN (...) clause
+        """
+        rows = self.db.select(
+            'SELECT "id", "expense_date", "amount" FROM "Expense" '
+            f'WHERE "id" IN ({placeholders})',
+            params,
+        )
+        return [(id, timestamp2datetime(date), amount) for id, date, amount in rows]
+
+    def _update_deltas(
+        self,
+        placeholders: str,
+        params: dict[str, typing.Any],
+        new_date: typing.Optional[datetime],
+        new_amount: typing.Optional[float],
+    ) -> list[tuple[datetime, float]]:
+        """
+        Returns spent budget deltas for setting new date and/or amount
+        to expenses with ids from IN (...) clause
+        """
+        deltas: list[tuple[datetime, float]] = []
+        if new_date is None and new_amount is None:
+            # Only amount and date changes affect spent budget
+            return deltas
+        for _, old_date, old_amount in self._select_amounts(placeholders, params):
+            deltas.append((old_date, -old_amount))
+            deltas.append(
+                (
+                    old_date if new_date is None else new_date,
+                    old_amount if new_amount is None else new_amount,
+                )
+            )
+        return deltas
+
+    def _apply_spent_deltas(self, deltas: list[tuple[datetime, float]]) -> None:
+        if deltas:
+            self.model.budget_model.apply_spent_deltas(deltas)
+
+    def _select_category_labels(self, ids: list[int]) -> dict[int, str]:
+        labels = {}
+        for chunk in chunked(list(dict.fromkeys(ids)), SQLITE_MAX_VARIABLES):
+            placeholders, params = sql_list_params("id", chunk)
+            sql = f'SELECT "id", "label" FROM "Category" WHERE "id" IN ({placeholders})'
+            labels.update(self.db.select(sql, params))
+        return labels
+
     @db_session
     def _form_ponyexpense(self, expense: Self.db.Expense) -> PonyExpense:
         atrs = expense.to_dict(exclude="category")
-        return PonyExpense(model=self, **atrs)
+        return PonyExpense(
+            model=self,
+            category_id=expense.category.id,
+            category_name=expense.category.name,
+            category_label=expense.category.label,
+            **atrs,
+        )
+
+    def _form_ponyexpense_from_row(self, row: tuple) -> PonyExpense:
+        """
+        Forms expense from raw row of _SELECT_COLUMNS without loading Pony entity
+        """
+        (
+            id,
+            amount,
+            expense_date,
+            added_date,
+            comment,
+            category_id,
+            category_name,
+            category_label,
+        ) = row
+        return PonyExpense(
+            model=self,
+            id=id,
+            amount=amount,
+            expense_date=timestamp2datetime(expense_date),
+            added_date=timestamp2datetime(added_date),
+            comment=comment,
+            category_id=category_id,
+            category_name=category_name,
+            category_label=category_label,
+        )
@@ -1,11 +1,286 @@
 from datetime import datetime
-from pony.orm import Database, Required, PrimaryKey, Optional, Set
+from pony.orm import (
+    Database,
+    Required,
+    PrimaryKey,
+    Optional,
+    Set,
+    composite_index,
+    db_session,
+)
 from bookkeeper.models.abstract_model import AbstractModel
 from bookkeeper.models.pony_models.pony_category_model import PonyCategoryModel
 from bookkeeper.models.pony_models.pony_expenses_model import PonyExpensesModel
 from bookkeeper.models.pony_models.pony_budget_model import PonyBudgetModel
 
 
+# Full-text index over Expense.comment, kept in sync by triggers
+_EXPENSE_COMMENT_FTS_SQL: list[str] = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS "ExpenseCommentFTS"
+    USING fts5("comment", content="Expense", content_rowid="id")
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS "expense_comment_fts_insert"
+    AFTER INSERT ON "Expense" BEGIN
+        INSERT INTO "ExpenseCommentFTS"("rowid", "comment")
+        VALUES (new."id", new."comment");
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS "expense_comment_fts_delete"
+    AFTER DELETE ON "Expense" BEGIN
+        INSERT INTO "ExpenseCommentFTS"("ExpenseCommentFTS", "rowid", "comment")
+        VALUES ('delete', old."id", old."comment");
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS "expense_comment_fts_update"
+    AFTER UPDATE OF "comment" ON "Expense" BEGIN
+        INSERT INTO "ExpenseCommentFTS"("ExpenseCommentFTS", "rowid", "comment")
+        VALUES ('delete', old."id", old."comment");
+        INSERT INTO "ExpenseCommentFTS"("rowid", "comment")
+        VALUES (new."id", new."comment");
+    END
+    """,
+]
+_EXPENSE_COMMENT_FTS_FILL_SQL: list[str] = [
+    """INSERT INTO "ExpenseCommentFTS"("ExpenseCommentFTS") VALUES ('rebuild')""",
+]
+
+# Amounts of expenses per day and category ("date" is YYYY-MM-DD),
+# kept in sync by triggers. Rows are removed when last expense is gone.
+_DAILY_TOTAL_SQL: list[str] = [
+    """
+    CREATE TABLE IF NOT EXISTS "DailyTotal" (
+        "date" TEXT NOT NULL,
+        "category" INTEGER NOT NULL,
+        "amount" REAL NOT NULL,
+        "count" INTEGER NOT NULL,
+        PRIMARY KEY ("date", "category")
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS "daily_total_insert"
+    AFTER INSERT ON "Expense" BEGIN
+        INSERT INTO "DailyTotal"("date", "category", "amount", "count")
+        VALUES (substr(new."expense_date", 1, 10), new."category", new."amount", 1)
+        ON CONFLICT("date", "category") DO UPDATE
+        SET "amount" = "amount" + excluded."amount", "count" = "count" + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS "daily_total_delete"
+    AFTER DELETE ON "Expense" BEGIN
+        UPDATE "DailyTotal" SET "amount" = "amount" - old."amount", "count" = "count" - 1
+        WHERE "date" = substr(old."expense_date", 1, 10)
+        AND "category" = old."category";
+        DELETE FROM "DailyTotal"
+        WHERE "date" = substr(old."expense_date", 1, 10)
+        AND "category" = old."category" AND "count" = 0;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS "daily_total_update"
+    AFTER UPDATE OF "amount", "expense_date", "category" ON "Expense" BEGIN
+        UPDATE "DailyTotal" SET "amount" = "amount" - old."amount", "count" = "count" - 1
+        WHERE "date" = substr(old."expense_date", 1, 10)
+        AND "category" = old."category";
+        DELETE FROM "DailyTotal"
+        WHERE "date" = substr(old."expense_date", 1, 10)
+        AND "category" = old."category" AND "count" = 0;
+        INSERT INTO "DailyTotal"("date", "category", "amount", "count")
+        VALUES (substr(new."expense_date", 1, 10), new."category", new."amount", 1)
+        ON CONFLICT("date", "category") DO UPDATE
+        SET "amount" = "amount" + excluded."amount", "count" = "count" + 1;
+    END
+    """,
+]
+_DAILY_TOTAL_FILL_SQL: list[str] = [
+    """
+    INSERT INTO "DailyTotal"("date", "category", "amount", "count")
+    SELECT substr("expense_date", 1, 10), "category", SUM("amount"), COUNT(*)
+    FROM "Expense" GROUP BY 1, 2
+    """,
+]
+
+
+# Pairs of categories with all their ancestors (including themselves with
+# depth 0), kept in sync by triggers on insert, reparenting and deletion
+_CATEGORY_CLOSURE_SQL: list[str] = [
+    """
+    CREATE TABLE IF NOT EXISTS "CategoryClosure" (
+        "ancestor" INTEGER NOT NULL,
+        "descendant" INTEGER NOT NULL,
+        "depth" INTEGER NOT NULL,
+        PRIMARY KEY ("ancestor", "descendant")
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS "idx_categoryclosure__descendant"
+    ON "CategoryClosure" ("descendant", "depth")
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS "category_closure_insert"
+    AFTER INSERT ON "Category" BEGIN
+        INSERT INTO "CategoryClosure"("ancestor", "descendant", "depth")
+        VALUES (new."id", new."id", 0);
+        INSERT INTO "CategoryClosure"("ancestor", "descendant", "depth")
+        SELECT "ancestor", new."id", "depth" + 1 FROM "CategoryClosure"
+        WHERE "descendant" = new."parent";
+    END
+    """,
+    # Subtree of moved category is detached from old ancestors
+    # and attached to ancestors of new parent
+    """
+    CREATE TRIGGER IF NOT EXISTS "category_closure_update"
+    AFTER UPDATE OF "parent" ON "Category"
+    WHEN old."parent" IS NOT new."parent" BEGIN
+        DELETE FROM "CategoryClosure"
+        WHERE "descendant" IN (
+            SELECT "descendant" FROM "CategoryClosure" WHERE "ancestor" = new."id"
+        )
+        AND "ancestor" IN (
+            SELECT "ancestor" FROM "CategoryClosure"
+            WHERE "descendant" = new."id" AND "ancestor" != new."id"
+        );
+        INSERT INTO "CategoryClosure"("ancestor", "descendant", "depth")
+        SELECT "a"."ancestor", "d"."descendant", "a"."depth" + "d"."depth" + 1
+        FROM "CategoryClosure" "a" JOIN "CategoryClosure" "d"
+        ON "a"."descendant" = new."parent" AND "d"."ancestor" = new."id";
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS "category_closure_delete"
+    AFTER DELETE ON "Category" BEGIN
+        DELETE FROM "CategoryClosure"
+        WHERE "ancestor" = old."id" OR "descendant" = old."id";
+    END
+    """,
+]
+# Depth is limited in case older versions made a cycle
+_CATEGORY_CLOSURE_FILL_SQL: list[str] = [
+    """
+    INSERT INTO "CategoryClosure"("ancestor", "descendant", "depth")
+    WITH RECURSIVE "closure"("ancestor", "descendant", "depth") AS (
+        SELECT "id", "id", 0 FROM "Category"
+        UNION ALL
+        SELECT "closure"."ancestor", "c"."id", "closure"."depth" + 1
+        FROM "closure" JOIN "Category" "c" ON "c"."parent" = "closure"."descendant"
+        WHERE "closure"."depth" < (SELECT count(*) FROM "Category")
+    )
+    SELECT "ancestor", "descendant", min("depth") FROM "closure"
+    GROUP BY "ancestor", "descendant"
+    """,
+]
+
+# Category columns written only by triggers: materialized path of ids
+# ("/1/5/9/") and full name label ("A > B > C"). Moved or renamed category
+# updates its whole subtree found by path prefix.
+_CATEGORY_PATH_COLUMNS: dict[str, str] = {"path": "TEXT", "label": "TEXT"}
+_CATEGORY_PATH_SQL: list[str] = [
+    """
+    CREATE INDEX IF NOT EXISTS "idx_category__path" ON "Category" ("path")
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS "category_path_insert"
+    AFTER INSERT ON "Category" BEGIN
+        UPDATE "Category" SET
+            "path" = coalesce(
+                (SELECT "path" FROM "Category" WHERE "id" = new."parent"), '/'
+            ) || new."id" || '/',
+            "label" = coalesce(
+                (SELECT "label" || ' > ' FROM "Category" WHERE "id" = new."parent"), ''
+            ) || new."name"
+        WHERE "id" = new."id";
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS "category_path_update"
+    AFTER UPDATE OF "name", "parent" ON "Category"
+    WHEN old."name" IS NOT new."name" OR old."parent" IS NOT new."parent" BEGIN
+        UPDATE "Category" SET
+            "path" = coalesce(
+                (SELECT "path" FROM "Category" WHERE "id" = new."parent"), '/'
+            ) || new."id" || '/' || substr("path", length(old."path") + 1),
+            "label" = coalesce(
+                (SELECT "label" || ' > ' FROM "Category" WHERE "id" = new."parent"), ''
+            ) || new."name" || substr("label", length(old."label") + 1)
+        WHERE "path" >= old."path" AND "path" < old."path" || '~';
+    END
+    """,
+]
+_CATEGORY_PATH_FILL_SQL: list[str] = [
+    """
+    CREATE TEMP TABLE "category_path_fill" (
+        "id" INTEGER PRIMARY KEY, "path" TEXT, "label" TEXT
+    )
+    """,
+    """
+    INSERT INTO "category_path_fill"("id", "path", "label")
+    WITH RECURSIVE "tree"("id", "path", "label") AS (
+        SELECT "id", '/' || "id" || '/', "name" FROM "Category" WHERE "parent" IS NULL
+        UNION ALL
+        SELECT "c"."id", "tree"."path" || "c"."id" || '/',
+               "tree"."label" || ' > ' || "c"."name"
+        FROM "Category" "c" JOIN "tree" ON "c"."parent" = "tree"."id"
+    )
+    SELECT "id", "path", "label" FROM "tree"
+    """,
+    """
+    UPDATE "Category" SET
+        "path" = (
+            SELECT "path" FROM "category_path_fill" "f" WHERE "f"."id" = "Category"."id"
+        ),
+        "label" = (
+            SELECT "label" FROM "category_path_fill" "f"
+            WHERE "f"."id" = "Category"."id"
+        )
+    """,
+    """
+    DROP TABLE "category_path_fill"
+    """,
+]
+
+
+def _create_raw_table(
+    db: Database, table: str, create_sql: list[str], fill_sql: list[str]
+) -> None:
+    """
+    Creates table not managed by Pony together with its triggers.
+    If the table did not exist (e.g. database was made by older version),
+    it is filled from existing data with fill_sql statements.
+    """
+    existed = db.select(
+        "SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name = $table"
+    )[0]
+    for sql in create_sql:
+        db.execute(sql)
+    if not existed:
+        for sql in fill_sql:
+            db.execute(sql)
+
+
+def _add_missing_columns(
+    db: Database, table: str, columns: dict[str, str]
+) -> list[str]:
+    """
+    Adds columns declared after the table was created by older version.
+    Pony does not alter existing tables, so for columns of entities it should
+    be called before generate_mapping. Nothing is done if the table does not
+    exist yet. Returns names of added columns.
+    """
+    existing = {row[1] for row in db.execute(f'PRAGMA table_info("{table}")')}
+    if not existing:
+        return []
+    added = []
+    for name, definition in columns.items():
+        if name not in existing:
+            db.execute(f'ALTER TABLE "{table}" ADD COLUMN "{name}" {definition}')
+            added.append(name)
+    return added
+
+
 def define_database(**dbparams) -> Database:
     db = Database(**dbparams)
 
@@ -14,8 +289,12 @@ def define_database(**dbparams) -> Database:
         id = PrimaryKey(int, auto=True)
         name = Required(str)
         expenses = Set("Expense")
-        parent = Optional("Category", reverse="children")
+        parent = Optional("Category", reverse="children", index=True)
         children = Set("Category", reverse="parent")
+        budgets = Set("Budget", cascade_delete=True)
+        # Kept in sync by triggers of _CATEGORY_PATH_SQL, so Pony only reads them
+        path = Optional(str, nullable=True, volatile=True)
+        label = Optional(str, nullable=True, volatile=True)
 
     class Budget(db.Entity):
         id = PrimaryKey(int, auto=True, unsigned=True)
@@ -23,17 +302,44 @@ def define_database(**dbparams) -> Database:
         daily = Optional(float)
         weekly = Optional(float)
         monthly = Optional(float)
+        # Limits for expenses of category and its subcategories, global if None
+        category = Optional(Category, index=True)
 
     class Expense(db.Entity):
         id = PrimaryKey(int, auto=True, nullable=False)
         amount = Required(float)
-        category = Required(Category)
-        expense_date = Required(datetime, default=lambda: datetime.now())
+        category = Required(Category, index=True)
+        expense_date = Required(datetime, default=lambda: datetime.now(), index=True)
         added_date = Required(datetime, default=lambda: datetime.now())
         comment = Optional(str)
+        composite_index(category, expense_date)
 
     # db.bind(provider='sqlite', filename='database.sqlite', create_db=True)
+    with db_session:
+        _add_missing_columns(
+            db,
+            "Budget",
+            {"category": 'INTEGER REFERENCES "Category" ("id") ON DELETE CASCADE'},
+        )
+        path_added = _add_missing_columns(db, "Category", _CATEGORY_PATH_COLUMNS)
+    # Also creates indexes missing in databases made by older versions
     db.generate_mapping(create_tables=True)
+    with db_session:
+        _create_raw_table(
+            db,
+            "ExpenseCommentFTS",
+            _EXPENSE_COMMENT_FTS_SQL,
+            _EXPENSE_COMMENT_FTS_FILL_SQL,
+        )
+        _create_raw_table(db, "DailyTotal", _DAILY_TOTAL_SQL, _DAILY_TOTAL_FILL_SQL)
+        _create_raw_table(
+            db, "CategoryClosure", _CATEGORY_CLOSURE_SQL, _CATEGORY_CLOSURE_FILL_SQL
+        )
+        if path_added:
+            for sql in _CATEGORY_PATH_FILL_SQL:
+                db.execute(sql)
+        for sql in _CATEGORY_PATH_SQL:
+            db.execute(sql)
 
     return db
 
@@ -0,0 +1,37 @@
+from typing import Any, Iterable, Iterator, Sequence, TypeVar
+
+T = TypeVar("T")
+
+# Default SQLITE_MAX_VARIABLE_NUMBER for SQLite builds older than 3.32
+SQLITE_MAX_VARIABLES: int = 999
+
+
+def chunked(items: Sequence[T], size: int) -> Iterator[Sequence[T]]:
+    """
+    Split sequence into consecutive slices of at most size elements
+    """
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def select_by_ids(entity: Any, ids: Iterable[int]) -> dict[int, Any]:
+    """
+    Loads entities by primary keys with one IN (...) query per chunk of ids.
+    Returns mapping from id to loaded entity, missing ids are skipped.
+    Should be called within db_session.
+    """
+    unique_ids = list(dict.fromkeys(ids))
+    loaded = {}
+    for chunk in chunked(unique_ids, SQLITE_MAX_VARIABLES):
+        for obj in entity.select(lambda o: o.id in chunk):
+            loaded[obj.id] = obj
+    return loaded
+
+
+def sql_list_params(prefix: str, values: Sequence[Any]) -> tuple[str, dict[str, Any]]:
+    """
+    Forms list of placeholders "$prefix0, $prefix1, ..." for Pony raw SQL
+    (e.g. for IN (...) clause) and dictionary with their values
+    """
+    names = [f"{prefix}{i}" for i in range(len(values))]
+    return ", ".join("$" + name for name in names), dict(zip(names, values))
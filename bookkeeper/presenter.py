@@ -24,7 +24,7 @@ from bookkeeper.exceptions import NoAccessError, NoAccessToGenericValuesError
 
 class Presenter:
     # Some constants
-    _MAX_EXPENSES_SHOWN: int = 100
+    _EXPENSES_PAGE_SIZE: int = 100
     _PRESET_NAMES_MAPPING: dict[str, str] = {
         "BUDGET_SPENT_GEN_PRESET": "Spent",
         "DEFAULT_BUDGET": "Budget",
@@ -35,6 +35,7 @@ class Presenter:
         self.model = model_instance
 
         self.budgets_shown: dict[int, ViewBudget] = {}
+        self._expenses_cursor: Optional[str] = None
         self._update_budget_spent()
         self.budgets_shown[self._budget_spent.id] = self._budget_spent
 
@@ -51,7 +52,9 @@ class Presenter:
         self.view.register_add_expense_handler(self.add_expense)
         self.view.register_change_expense_handler(self.change_expense)
         self.view.register_delete_expenses_handler(self.delete_expenses)
+        self.view.register_load_more_expenses_handler(self.load_more_expenses)
         self.view.register_change_budget_handler(self.change_budget)
+        self._schedule_spent_rollover()
 
         self.view.start()
 
@@ -61,12 +64,23 @@ class Presenter:
         self.view.refresh_categories(all_cats_view)
 
     def refresh_expenses(self) -> None:
-        all_expenses = self.model.expenses_model.get_expenses_by_constraints(
-            [], max_num=self._MAX_EXPENSES_SHOWN
-        )
-        view_expenses = [self._form_view_expense(exp) for exp in all_expenses]
+        page = self.model.expenses_model.get_expenses_page([], self._EXPENSES_PAGE_SIZE)
+        self._expenses_cursor = page.next_cursor
+        view_expenses = [self._form_view_expense(exp) for exp in page.expenses]
         self.view.refresh_expenses_table(view_expenses)
 
+    def load_more_expenses(self) -> None:
+        """
+        Appends next page of older expenses to the view, if there is any
+        """
+        if self._expenses_cursor is None:
+            return
+        page = self.model.expenses_model.get_expenses_page(
+            [], self._EXPENSES_PAGE_SIZE, self._expenses_cursor
+        )
+        self._expenses_cursor = page.next_cursor
+        self.view.update_expenses([self._form_view_expense(exp) for exp in page.expenses])
+
     def refresh_budgets(self) -> None:
         self._update_budget_spent()
         if len(self.budgets_shown) <= 1:
@@ -77,25 +91,26 @@ class Presenter:
                 )
             default_budget = self._form_view_budget(default_budget)
             self.budgets_shown[default_budget.id] = default_budget
-        else:
-            for id in self.budgets_shown:
-                self.budgets_shown[id] = self._form_view_budget(
-                    self.model.budget_model.get_budget_by_id(id)
-                )
+        # Shown budgets are rebuilt from all budgets at once: spent budget is
+        # already refreshed, category budgets are added and budgets deleted
+        # with their categories are dropped
+        budgets_shown = {self._budget_spent.id: self._budget_spent}
+        for budget in self.model.budget_model.get_all_budgets():
+            if budget.id == self._budget_spent.id:
+                continue
+            if budget.id in self.budgets_shown or budget.category_id is not None:
+                budgets_shown[budget.id] = self._form_view_budget(budget)
+        self.budgets_shown = budgets_shown
         self.view.refresh_budgets(list(self.budgets_shown.values()))
 
     def _form_view_category(self, category: AbstractCategory) -> ViewCategory:
-        parent = category.get_parent()
-        if parent is None:
-            return ViewCategory(category.id, category.name, None)
-        else:
-            return ViewCategory(category.id, category.name, parent.id)
+        return ViewCategory(category.id, category.name, category.parent_id)
 
     def _form_view_expense(self, expense: AbstractExpense) -> ViewExpense:
         return ViewExpense(
             expense.id,
             self._represent_amount(expense.amount),
-            expense.get_category().name,
+            expense.category_label,
             self._represent_date(expense.expense_date),
             expense.comment,
         )
@@ -123,7 +138,7 @@ class Presenter:
         return date.strftime(_COMMON_DATETIME_FMT)
 
     def _update_budget_spent(self) -> None:
-        self.model.budget_model.update_spent_budget()
+        # Spent budget is kept up to date by the model on expense changes
         self._budget_spent = self._form_view_budget(
             self.model.budget_model.get_spent_budget(), editable=False
         )
@@ -155,11 +170,29 @@ class Presenter:
 
     def update_budget_spent(self) -> None:
         """
-        Updates spent budget either in view
+        Recomputes spent budget from scratch and updates it in view
         """
+        self.model.budget_model.update_spent_budget()
         self._update_budget_spent()
         self.view.update_budgets([self._budget_spent])
 
+    def _schedule_spent_rollover(self) -> None:
+        self._spent_rollover_moment = self.model.budget_model.get_spent_rollover()
+        self.view.schedule(self._spent_rollover_moment, self._spent_rollover)
+
+    def _spent_rollover(self) -> None:
+        """
+        Shows budgets recomputed for new day, week or month and
+        schedules the next rollover
+        """
+        if datetime.now() < self._spent_rollover_moment:
+            # View may call handler slightly earlier, the day is not over yet
+            self.view.schedule(self._spent_rollover_moment, self._spent_rollover)
+            return
+        # Model recomputes spent budgets itself once the day is over
+        self.refresh_budgets()
+        self._schedule_spent_rollover()
+
     def add_category(self, name: str, parent: Optional[int] = None) -> None:
         if parent is not None:
             parent = self.model.category_model.get_category_by_id(parent)
@@ -264,9 +297,7 @@ class Presenter:
         self.refresh_budgets()
 
     def delete_expenses(self, expense_ids: list[int]) -> None:
-        for expense_id in expense_ids:
-            expense_to_remove = self.model.expenses_model.get_expense_by_id(expense_id)
-            self.model.expenses_model.delete_expense(expense_to_remove)
+        self.model.expenses_model.delete_expenses_by_ids(expense_ids)
         self.view.remove_expenses(expense_ids)
         self.refresh_budgets()
 
@@ -8,7 +8,7 @@
 """
 
 from abc import ABC, abstractmethod
-from typing import Generic, TypeVar, Protocol, Any
+from typing import Generic, TypeVar, Protocol, Any, Iterable
 
 
 class Model(Protocol):  # pylint: disable=too-few-public-methods
@@ -30,6 +30,8 @@ class AbstractRepository(ABC, Generic[T]):
     get_all
     update
     delete
+    Пакетные методы add_many и update_many по умолчанию вызывают add и update
+    для каждого объекта, репозитории могут переопределять их более эффективно.
     """
 
     @abstractmethod
@@ -39,6 +41,13 @@ class AbstractRepository(ABC, Generic[T]):
         также записать id в атрибут pk.
         """
 
+    def add_many(self, objs: Iterable[T]) -> list[int]:
+        """
+        Добавить несколько объектов, вернуть список их id,
+        также записать id в атрибут pk каждого объекта.
+        """
+        return [self.add(obj) for obj in objs]
+
     @abstractmethod
     def get(self, pk: int) -> T | None:
         """ Получить объект по id """
@@ -55,6 +64,11 @@ class AbstractRepository(ABC, Generic[T]):
     def update(self, obj: T) -> None:
         """ Обновить данные об объекте. Объект должен содержать поле pk. """
 
+    def update_many(self, objs: Iterable[T]) -> None:
+        """ Обновить данные о нескольких объектах """
+        for obj in objs:
+            self.update(obj)
+
     @abstractmethod
     def delete(self, pk: int) -> None:
         """ Удалить запись """
@@ -3,24 +3,69 @@
 """
 
 from itertools import count
-from typing import Any
+from typing import Any, Generic, Iterable
 
 from bookkeeper.repository.abstract_repository import AbstractRepository, T
 
 
+class _HashIndex(Generic[T]):
+    """
+    Хеш-индекс по атрибуту attr: для каждого значения атрибута хранит
+    объекты с этим значением в порядке возрастания pk
+    """
+
+    def __init__(self, attr: str) -> None:
+        self.attr = attr
+        self._buckets: dict[Any, dict[int, T]] = {}
+        self._values: dict[int, Any] = {}
+
+    def add(self, pk: int, obj: T) -> None:
+        value = getattr(obj, self.attr)
+        bucket = self._buckets.setdefault(value, {})
+        in_order = not bucket or pk > next(reversed(bucket))
+        bucket[pk] = obj
+        if not in_order:
+            self._buckets[value] = dict(sorted(bucket.items()))
+        self._values[pk] = value
+
+    def update(self, pk: int, obj: T) -> None:
+        if pk not in self._values:
+            self.add(pk, obj)
+        elif getattr(obj, self.attr) == self._values[pk]:
+            self._buckets[self._values[pk]][pk] = obj
+        else:
+            self.remove(pk)
+            self.add(pk, obj)
+
+    def remove(self, pk: int) -> None:
+        value = self._values.pop(pk)
+        bucket = self._buckets[value]
+        del bucket[pk]
+        if not bucket:
+            del self._buckets[value]
+
+    def get(self, value: Any) -> list[T]:
+        return list(self._buckets.get(value, {}).values())
+
+
 class MemoryRepository(AbstractRepository[T]):
     """
     Репозиторий, работающий в оперативной памяти. Хранит данные в словаре.
+    indexed - атрибуты, для которых поддерживаются хеш-индексы, выборка
+    get_all по равенству такого атрибута не перебирает все объекты.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, indexed: Iterable[str] = ()) -> None:
         self._container: dict[int, T] = {}
         self._counter = count(1)
+        self._indexes = {attr: _HashIndex[T](attr) for attr in indexed}
 
     def add(self, obj: T) -> int:
         if getattr(obj, 'pk', None) != 0:
             raise ValueError(f'trying to add object {obj} with filled `pk` attribute')
         pk = next(self._counter)
+        for index in self._indexes.values():
+            index.add(pk, obj)
         self._container[pk] = obj
         obj.pk = pk
         return pk
@@ -31,13 +76,24 @@ class MemoryRepository(AbstractRepository[T]):
     def get_all(self, where: dict[str, Any] | None = None) -> list[T]:
         if where is None:
             return list(self._container.values())
-        return [obj for obj in self._container.values()
+        indexed = next((attr for attr in where if attr in self._indexes), None)
+        objects: Iterable[T]
+        if indexed is None:
+            objects = self._container.values()
+        else:
+            objects = self._indexes[indexed].get(where[indexed])
+            where = {attr: value for attr, value in where.items() if attr != indexed}
+        return [obj for obj in objects
                 if all(getattr(obj, attr) == value for attr, value in where.items())]
 
     def update(self, obj: T) -> None:
         if obj.pk == 0:
             raise ValueError('attempt to update object with unknown primary key')
+        for index in self._indexes.values():
+            index.update(obj.pk, obj)
         self._container[obj.pk] = obj
 
     def delete(self, pk: int) -> None:
         self._container.pop(pk)
+        for index in self._indexes.values():
+            index.remove(pk)
@@ -0,0 +1,202 @@
+"""
+Модуль описывает репозиторий, работающий в СУБД SQLite
+"""
+
+import sqlite3
+from contextlib import contextmanager
+from dataclasses import fields
+from datetime import date, datetime
+from types import NoneType, UnionType
+from typing import (Any, Callable, Iterable, Iterator, Union,
+                    get_args, get_origin, get_type_hints)
+
+from bookkeeper.repository.abstract_repository import AbstractRepository, T
+
+_COLUMN_TYPES: dict[type, str] = {
+    int: 'INTEGER',
+    float: 'REAL',
+    str: 'TEXT',
+    datetime: 'TIMESTAMP',
+    date: 'DATE',
+}
+
+_CONVERTERS: dict[type, Callable[[str], Any]] = {
+    datetime: datetime.fromisoformat,
+    date: date.fromisoformat,
+}
+
+
+def _field_type(hint: Any) -> type:
+    """ Тип значения поля, для X | None - тип X """
+    if get_origin(hint) in (Union, UnionType):
+        args = [arg for arg in get_args(hint) if arg is not NoneType]
+        if len(args) == 1:
+            return args[0]
+    return hint
+
+
+def _adapt(value: Any) -> Any:
+    """ Значение поля для записи в базу данных """
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+class SQLiteRepository(AbstractRepository[T]):
+    """
+    Репозиторий, работающий в СУБД SQLite. Объекты хранятся в таблице
+    с именем класса в нижнем регистре, столбцы таблицы соответствуют
+    полям датакласса cls. Поддерживаются поля типов int, float, str,
+    datetime, date (в том числе X | None).
+    Все запросы выполняются через одно соединение в режиме WAL.
+
+    db_file - файл базы данных
+    cls - класс хранимых объектов (датакласс с полем pk)
+    indexed - поля, по которым строятся индексы для выборок get_all
+    """
+
+    def __init__(self, db_file: str, cls: type,
+                 indexed: Iterable[str] = ()) -> None:
+        self._cls = cls
+        hints = get_type_hints(cls)
+        self._fields = [f.name for f in fields(cls) if f.name != 'pk']
+        types = {name: _field_type(hints[name]) for name in self._fields}
+        for name, field_type in types.items():
+            if field_type not in _COLUMN_TYPES:
+                raise TypeError(f'unsupported type {field_type} of field `{name}`')
+        # Индексы конвертеров в строке результата запроса (pk - последний столбец)
+        self._converters = [(i, _CONVERTERS[types[name]])
+                            for i, name in enumerate(self._fields)
+                            if types[name] in _CONVERTERS]
+
+        self._connection = sqlite3.connect(db_file, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode = WAL')
+        self._connection.execute('PRAGMA synchronous = NORMAL')
+
+        table = cls.__name__.lower()
+        columns = ', '.join(f'"{name}" {_COLUMN_TYPES[types[name]]}'
+                            for name in self._fields)
+        self._connection.execute(
+            f'CREATE TABLE IF NOT EXISTS "{table}" '
+            f'("pk" INTEGER PRIMARY KEY, {columns})')
+        for name in indexed:
+            self._check_field(name)
+            self._connection.execute(
+                f'CREATE INDEX IF NOT EXISTS "idx_{table}__{name}" '
+                f'ON "{table}" ("{name}")')
+
+        names = ', '.join(f'"{name}"' for name in self._fields)
+        placeholders = ', '.join('?' * len(self._fields))
+        assignments = ', '.join(f'"{name}" = ?' for name in self._fields)
+        self._insert_sql = f'INSERT INTO "{table}" ({names}, "pk") ' \
+                           f'VALUES ({placeholders}, ?)'
+        self._select_sql = f'SELECT {names}, "pk" FROM "{table}"'
+        self._get_sql = f'{self._select_sql} WHERE "pk" = ?'
+        self._max_pk_sql = f'SELECT coalesce(max("pk"), 0) FROM "{table}"'
+        self._update_sql = f'UPDATE "{table}" SET {assignments} WHERE "pk" = ?'
+        self._delete_sql = f'DELETE FROM "{table}" WHERE "pk" = ?'
+        # Тексты запросов get_all по набору полей условия. Сами запросы
+        # sqlite3 хранит скомпилированными в кэше соединения по их тексту.
+        self._where_sql: dict[tuple[str, ...], str] = {}
+
+    def close(self) -> None:
+        """ Закрыть соединение с базой данных """
+        self._connection.close()
+
+    def add(self, obj: T) -> int:
+        if getattr(obj, 'pk', None) != 0:
+            raise ValueError(f'trying to add object {obj} with filled `pk` attribute')
+        cursor = self._connection.execute(self._insert_sql, self._params(obj, None))
+        obj.pk = cursor.lastrowid
+        return obj.pk
+
+    def add_many(self, objs: Iterable[T]) -> list[int]:
+        objs = list(objs)
+        for obj in objs:
+            if getattr(obj, 'pk', None) != 0:
+                raise ValueError(
+                    f'trying to add object {obj} with filled `pk` attribute')
+        with self._transaction() as cursor:
+            first_pk = cursor.execute(self._max_pk_sql).fetchone()[0] + 1
+            pks = list(range(first_pk, first_pk + len(objs)))
+            cursor.executemany(self._insert_sql,
+                               (self._params(obj, pk) for obj, pk in zip(objs, pks)))
+        for obj, pk in zip(objs, pks):
+            obj.pk = pk
+        return pks
+
+    def get(self, pk: int) -> T | None:
+        row = self._connection.execute(self._get_sql, (pk,)).fetchone()
+        return None if row is None else self._form_object(row)
+
+    def get_all(self, where: dict[str, Any] | None = None) -> list[T]:
+        if not where:
+            rows = self._connection.execute(self._select_sql)
+        else:
+            rows = self._connection.execute(
+                self._get_where_sql(tuple(where)),
+                [_adapt(value) for value in where.values()])
+        return [self._form_object(row) for row in rows]
+
+    def update(self, obj: T) -> None:
+        if obj.pk == 0:
+            raise ValueError('attempt to update object with unknown primary key')
+        cursor = self._connection.execute(self._update_sql, self._params(obj, obj.pk))
+        if cursor.rowcount == 0:
+            raise KeyError(obj.pk)
+
+    def update_many(self, objs: Iterable[T]) -> None:
+        objs = list(objs)
+        if any(obj.pk == 0 for obj in objs):
+            raise ValueError('attempt to update object with unknown primary key')
+        with self._transaction() as cursor:
+            cursor.executemany(self._update_sql,
+                               (self._params(obj, obj.pk) for obj in objs))
+            if cursor.rowcount != len(objs):
+                raise KeyError('some of objects are not found')
+
+    def delete(self, pk: int) -> None:
+        cursor = self._connection.execute(self._delete_sql, (pk,))
+        if cursor.rowcount == 0:
+            raise KeyError(pk)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Cursor]:
+        cursor = self._connection.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            yield cursor
+        except BaseException:
+            cursor.execute('ROLLBACK')
+            raise
+        cursor.execute('COMMIT')
+
+    def _check_field(self, name: str) -> None:
+        if name != 'pk' and name not in self._fields:
+            raise ValueError(f'unknown field `{name}`')
+
+    def _get_where_sql(self, names: tuple[str, ...]) -> str:
+        sql = self._where_sql.get(names)
+        if sql is None:
+            for name in names:
+                self._check_field(name)
+            # IS сравнивает и с NULL, и так же, как =, использует индекс
+            condition = ' AND '.join(f'"{name}" IS ?' for name in names)
+            sql = self._where_sql[names] = f'{self._select_sql} WHERE {condition}'
+        return sql
+
+    def _params(self, obj: T, pk: int | None) -> list[Any]:
+        params = [_adapt(getattr(obj, name)) for name in self._fields]
+        params.append(pk)
+        return params
+
+    def _form_object(self, row: tuple[Any, ...]) -> T:
+        values = list(row)
+        for i, converter in self._converters:
+            if values[i] is not None:
+                values[i] = converter(values[i])
+        obj = self._cls(**dict(zip(self._fields, values)))
+        obj.pk = values[-1]
+        return obj
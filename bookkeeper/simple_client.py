@@ -7,7 +7,7 @@ from bookkeeper.models.expense import Expense
 from bookkeeper.repository.memory_repository import MemoryRepository
 from bookkeeper.utils import read_tree
 
-cat_repo = MemoryRepository[Category]()
+cat_repo = MemoryRepository[Category](indexed=['name'])
 exp_repo = MemoryRepository[Expense]()
 
 cats = '''
@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import Callable, Protocol, Optional, Any
 from bookkeeper.core import CategoryDeletePolicy, ExpensesHandlingPolicy
 from bookkeeper.view.view_data import (
@@ -90,6 +91,14 @@ class AbstractView(Protocol):
         """
         ...
 
+    def schedule(self, moment: datetime, handler: Callable[[], None]) -> None:
+        """
+        Calls handler once within view event loop at the moment provided
+        (or right away if it is already passed). Handler may be called
+        slightly earlier, so it should check the time itself.
+        """
+        ...
+
     # Methods for notifying Presenter
 
     def register_add_category_handler(
@@ -148,6 +157,16 @@ class AbstractView(Protocol):
         """
         ...
 
+    def register_load_more_expenses_handler(
+            self, handler: Callable[[], None]
+    ) -> None:
+        """
+        Register handler requesting next page of older expenses in the form:
+        handler ~ load_more_expenses()
+        Pages are delivered through update_expenses
+        """
+        ...
+
     def register_change_expense_handler(
         self, handler: Callable[[int, dict[ExpenseField, Any]], None]
     ) -> None:
@@ -98,6 +98,7 @@ class ExpensesTableWidget(QtWidgets.QWidget):
         self.table.itemDoubleClicked.connect(self._item_double_clicked_slot)
         self.table.setContextMenuPolicy(QtCore.Qt.ContextMenuPolicy.CustomContextMenu)
         self.table.customContextMenuRequested.connect(self._show_popup_slot)
+        self.table.verticalScrollBar().valueChanged.connect(self._scrolled_slot)
 
         # Registering errors
         self.data_error_msg = QtWidgets.QErrorMessage()
@@ -128,6 +129,7 @@ class ExpensesTableWidget(QtWidgets.QWidget):
         self.table.setRowCount(len(expenses))
         for i in range(len(expenses)):
             self.set_row(i, expenses[i])
+        self._load_more_if_not_scrollable()
 
     def update(self, expenses: list[ViewExpense]) -> None:
         to_add = []
@@ -165,6 +167,7 @@ class ExpensesTableWidget(QtWidgets.QWidget):
                 self.table.removeRow(row)
             else:
                 failed = True
+        self._load_more_if_not_scrollable()
         if failed:
             raise GUIRemoveError("Some of expenses already were not in table")
 
@@ -204,6 +207,22 @@ class ExpensesTableWidget(QtWidgets.QWidget):
     def _update_category_slot(self, id: int, new_category_id: int) -> None:
         self._expense_update_handler(id, {ExpenseField.category: new_category_id})
 
+    @QtCore.Slot()
+    def _scrolled_slot(self, value: int) -> None:
+        if value == self.table.verticalScrollBar().maximum():
+            self._load_more_expenses_handler()
+
+    def _load_more_if_not_scrollable(self) -> None:
+        # More expenses are requested by scrolling to the end, which is not
+        # possible while all rows fit in the table, so they are requested now.
+        # Scroll range of hidden table is always empty.
+        if not self.table.isVisible():
+            return
+        # Scroll range is updated with delayed layout, so layout is done now
+        self.table.doItemsLayout()
+        if self.table.verticalScrollBar().maximum() == 0:
+            self._load_more_expenses_handler()
+
     @QtCore.Slot()
     def _show_popup_slot(self, pos) -> None:
         self.context_menu_executed_item = self.table.itemAt(pos)
@@ -245,6 +264,11 @@ class ExpensesTableWidget(QtWidgets.QWidget):
     ) -> None:
         self._delete_expenses_handler = handler
 
+    def register_load_more_expenses_handler(
+            self, handler: Callable[[], None]
+    ) -> None:
+        self._load_more_expenses_handler = handler
+
     # Utility functions
     def _form_view_expense(self, expense: ExpenseTableRowItem) -> ViewExpense:
         return ViewExpense(
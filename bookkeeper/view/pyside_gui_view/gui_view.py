@@ -1,8 +1,9 @@
 from __future__ import annotations
+import math
 import sys
 from datetime import datetime
 from typing import Callable, Any
-from PySide6 import QtWidgets
+from PySide6 import QtCore, QtWidgets
 
 from bookkeeper.core import CategoryDeletePolicy, ExpensesHandlingPolicy
 from bookkeeper.view.abstract_view import AbstractView
@@ -20,6 +21,8 @@ class GUI_Based_View(AbstractView):
         self.main_window.resize(400, 600)
         self.central_widget = BookKeeperLayout()
         self.main_window.setCentralWidget(self.central_widget)
+        # Pending timers of schedule, references keep them alive until fired
+        self._schedule_timers: set[QtCore.QTimer] = set()
 
     def start(self) -> None:
         self.main_window.show()
@@ -61,6 +64,22 @@ class GUI_Based_View(AbstractView):
     def remove_budgets(self, budget_ids: list[int]) -> None:
         self.central_widget.budget_widget.remove_budgets(budget_ids)
 
+    def schedule(self, moment: datetime, handler: Callable[[], None]) -> None:
+        delay = max(0, math.ceil((moment - datetime.now()).total_seconds() * 1000))
+        timer = QtCore.QTimer(self.main_window)
+        timer.setSingleShot(True)
+        # Coarse timers of long intervals are allowed to fire 5% earlier
+        timer.setTimerType(QtCore.Qt.TimerType.PreciseTimer)
+
+        def fire() -> None:
+            self._schedule_timers.discard(timer)
+            timer.deleteLater()
+            handler()
+
+        timer.timeout.connect(fire)
+        timer.start(delay)
+        self._schedule_timers.add(timer)
+
     # Binding handlers from protocol
 
     def register_add_category_handler(
@@ -122,6 +141,13 @@ class GUI_Based_View(AbstractView):
             handler
         )
 
+    def register_load_more_expenses_handler(
+            self, handler: Callable[[], None]
+    ) -> None:
+        self.central_widget.expenses_table_widget.register_load_more_expenses_handler(
+            handler
+        )
+
     def register_change_budget_handler(
         self, handler: Callable[[str, str, str, str], None]
     ) -> None:
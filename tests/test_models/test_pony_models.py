@@ -1,5 +1,8 @@
-from datetime import datetime
+from dataclasses import replace
+from datetime import date, datetime, time, timedelta
+import sqlite3
 import pytest
+from pony.orm import db_session
 
 from bookkeeper.core import (
     CategoryDeletePolicy,
@@ -9,15 +12,23 @@ from bookkeeper.models.abstract_expense_model import (
     ConstraintType,
     ExpenseConstraint,
     ExpenseField,
+    ExpenseRecord,
+    SeriesBucket,
 )
 from bookkeeper.models.pony_models.pony_model import PonyModel
+from bookkeeper.models.abstract_category_model import CategoryField
 from bookkeeper.models.pony_models.pony_category_model import (
+    CategoryCacheInfo,
     PonyCategoryModel,
 )
 from bookkeeper.models.pony_models.pony_expenses_model import (
     PonyExpensesModel,
 )
+from bookkeeper.models.pony_models.pony_budget_model import (
+    PonyBudgetModel,
+)
 from bookkeeper.exceptions import (
+    CategoryCycleError,
     NoDataError,
     PrimaryKeyAssignmentError,
     ConstraintError,
@@ -40,6 +51,11 @@ def exp_model(model_for_test) -> PonyExpensesModel:
     return model_for_test.expenses_model
 
 
+@pytest.fixture(scope="module")
+def budget_model(model_for_test) -> PonyBudgetModel:
+    return model_for_test.budget_model
+
+
 @pytest.fixture(scope="module")
 def some_cats(cat_model):
     return [cat_model.add_category(f"Category {i}") for i in range(5)]
@@ -140,6 +156,11 @@ class TestCategory:
             cats2 = e.args[1]
             assert cats2 == some_cats
 
+    def test_get_categories_by_ids_keeps_order(self, cat_model, some_cats):
+        ids = [c.id for c in reversed(some_cats)]
+        cats = cat_model.get_categories_by_ids(ids)
+        assert cats == list(reversed(some_cats))
+
     def test_delete_category(self, cat_model):
         c1 = cat_model.add_category("name")
         c1id = c1.id
@@ -225,6 +246,24 @@ class TestCategory:
         for id in exp_ids:
             assert c0 == exp_model.get_expense_by_id(id).get_category()
 
+    def test_delete_category_moving_children_and_exps(
+        self, cat_model, cat_tree, exp_model
+    ):
+        (c0, c05, c1, c2) = cat_tree
+        exp_ids = [exp_model.add_expense(100, c).id for c in (c1[0], c1[0], c1[1])]
+        (n1, n2) = c1[0].delete(CategoryDeletePolicy.move, ExpensesHandlingPolicy.move)
+        assert (n1, n2) == (6, 2)
+        assert cat_model.get_children(c05) == [c1[1], c1[2], c1[3], c1[4]] + c2[0]
+        assert [
+            e.category_id for e in exp_model.get_expenses_by_ids(exp_ids)
+        ] == [c05.id, c05.id, c1[1].id]
+
+    def test_delete_missing_category(self, cat_model):
+        cat = cat_model.add_category("to delete twice")
+        cat_model.delete_category(replace(cat))
+        with pytest.raises(NoDataError):
+            cat_model.delete_category(cat)
+
     def test_rename_category(self, cat_model):
         c = cat_model.add_category(name="name")
         c2 = cat_model.rename_category(c, "test")
@@ -249,6 +288,151 @@ class TestCategory:
         children = [cat_model.add_category(f"child{i}", parent=c1) for i in range(5)]
         assert set(c1.get_children()) == set(children)
 
+    def test_get_whole_subtree(self, cat_model, cat_tree):
+        (c0, c05, c1, c2) = cat_tree
+        expected = [c0, c05]
+        for j in range(5):
+            expected.append(c1[j])
+            expected.extend(c2[j])
+        assert cat_model.get_whole_subtree(c0) == expected
+        assert cat_model.get_whole_subtree(c1[2]) == [c1[2]] + c2[2]
+        subtree = cat_model.get_whole_subtree(c05)
+        assert [c.parent_id for c in subtree[:3]] == [c0.id, c05.id, c1[0].id]
+
+    def test_get_all_categories_in_depth_first_order(self, cat_model, cat_tree):
+        all_cats = cat_model.get_all_categories()
+        assert len(all_cats) == len(set(all_cats))
+        position = {cat.id: i for i, cat in enumerate(all_cats)}
+        for cat in all_cats:
+            if cat.parent_id is None:
+                continue
+            # Parent goes before child and all categories in between are
+            # from the subtree of the parent
+            parent_pos = position[cat.parent_id]
+            assert parent_pos < position[cat.id]
+            for between in all_cats[parent_pos + 1:position[cat.id]]:
+                assert between.parent_id is not None
+
+    def test_get_whole_subtree_of_missing_category(self, cat_model):
+        cat = cat_model.add_category("missing")
+        cat_model.delete_category(cat_model.get_category_by_id(cat.id))
+        with pytest.raises(NoDataError):
+            cat_model.get_whole_subtree(cat)
+
+    def test_categories_cache_counters(self):
+        model = PonyModel(provider="sqlite", filename=":memory:")
+        cats = model.category_model
+        parent = cats.add_category("parent")
+        child = cats.add_category("child", parent=parent)
+        assert cats.get_cache_info() == CategoryCacheInfo(hits=0, misses=0, size=0)
+        assert cats.get_all_categories() == [parent, child]
+        assert child.get_parent() == parent
+        assert parent.get_children() == [child]
+        assert cats.get_category_by_id(child.id).parent_id == parent.id
+        assert cats.get_cache_info() == CategoryCacheInfo(hits=3, misses=1, size=2)
+        cats.invalidate_cache()
+        assert cats.get_root_categories() == [parent]
+        assert cats.get_cache_info().misses == 2
+
+    def test_categories_cache_written_through(self, tmp_path):
+        filename = str(tmp_path / "cache.sqlite")
+        model = PonyModel(provider="sqlite", filename=filename, create_db=True)
+        cats = model.category_model
+        a = cats.add_category("a")
+        b = cats.add_category("b", parent=a)
+        c = cats.add_category("c", parent=b)
+        d = cats.add_category("d", parent=c)
+        cats.get_all_categories()  # Load cache before writes
+        e = cats.add_category("e", parent=a)
+        cats.rename_category(e, "e renamed")
+        cats.update_category(d, {CategoryField.parent: a.id, CategoryField.name: "d2"})
+        cats.delete_category(b, children_policy=CategoryDeletePolicy.move)
+        cats.delete_category(cats.add_category("f", parent=c))
+        expected = [(x.id, x.name, x.parent_id) for x in cats.get_all_categories()]
+        assert cats.get_cache_info().misses == 1
+        fresh = PonyModel(provider="sqlite", filename=filename).category_model
+        assert expected == [
+            (x.id, x.name, x.parent_id) for x in fresh.get_all_categories()
+        ]
+        assert expected == [
+            (a.id, "a", None),
+            (c.id, "c", a.id),
+            (d.id, "d2", a.id),
+            (e.id, "e renamed", a.id),
+        ]
+        with pytest.raises(NoDataError):
+            cats.get_children(b)
+
+    def test_get_ancestors(self, cat_model, cat_tree):
+        (c0, c05, c1, c2) = cat_tree
+        assert cat_model.get_ancestors(c2[3][1]) == [c1[3], c05, c0]
+        assert cat_model.get_ancestors(c0) == []
+
+    def test_is_in_subtree(self, cat_model, cat_tree):
+        (c0, c05, c1, c2) = cat_tree
+        assert cat_model.is_in_subtree(c2[1][4], c0)
+        assert cat_model.is_in_subtree(c05, c05)
+        assert not cat_model.is_in_subtree(c2[1][4], c1[2])
+        assert not cat_model.is_in_subtree(c0, c05)
+
+    def test_update_category_rejects_cycle(self, cat_model, cat_tree):
+        (c0, c05, c1, c2) = cat_tree
+        for new_parent in (c0, c2[2][0]):
+            with pytest.raises(CategoryCycleError):
+                cat_model.update_category(c0, {CategoryField.parent: new_parent.id})
+        assert cat_model.get_category_by_id(c0.id).parent_id is None
+
+    def test_category_closure_follows_tree(self):
+        model = PonyModel(provider="sqlite", filename=":memory:")
+        cats = model.category_model
+        a = cats.add_category("a")
+        b = cats.add_category("b", parent=a)
+        c = cats.add_category("c", parent=b)
+        d = cats.add_category("d", parent=c)
+        e = cats.add_category("e", parent=a)
+        cats.add_category("f", parent=e)
+        cats.update_category(c, {CategoryField.parent: e.id})
+        cats.update_category(b, {CategoryField.parent: None})
+        cats.delete_category(e, children_policy=CategoryDeletePolicy.move)
+        cats.add_category("g", parent=d)
+        parents = {x.id: x.parent_id for x in cats.get_all_categories()}
+        expected = set()
+        for id in parents:
+            ancestor, depth = id, 0
+            while ancestor is not None:
+                expected.add((ancestor, id, depth))
+                ancestor, depth = parents[ancestor], depth + 1
+        with db_session:
+            closure = set(
+                model.db.select(
+                    'SELECT "ancestor", "descendant", "depth" FROM "CategoryClosure"'
+                )
+            )
+        assert closure == expected
+        assert [x.id for x in cats.get_ancestors(d)] == [c.id, a.id]
+
+    def test_category_paths_follow_tree(self):
+        model = PonyModel(provider="sqlite", filename=":memory:")
+        cats = model.category_model
+        a = cats.add_category("a")
+        b = cats.add_category("b", parent=a)
+        c = cats.add_category("c", parent=b)
+        d = cats.add_category("d", parent=c)
+        e = cats.add_category("e")
+        cats.update_category(b, {CategoryField.parent: e.id})
+        cats.update_category(e, {CategoryField.name: "x"})
+        cats.delete_category(c, children_policy=CategoryDeletePolicy.move)
+        with db_session:
+            rows = model.db.select(
+                'SELECT "id", "path", "label" FROM "Category" ORDER BY "id"'
+            )
+        assert rows == [
+            (a.id, f"/{a.id}/", "a"),
+            (b.id, f"/{e.id}/{b.id}/", "x > b"),
+            (d.id, f"/{e.id}/{b.id}/{d.id}/", "x > b > d"),
+            (e.id, f"/{e.id}/", "x"),
+        ]
+
 
 class TestExpense:
     def test_add_expense(self, exp_model, some_cats):
@@ -277,6 +461,35 @@ class TestExpense:
         assert e2.added_date <= timing2 and e2.added_date >= timing1
         assert e2.comment == "I love python"
 
+    def test_add_expenses(self, exp_model, some_cats):
+        records = [
+            ExpenseRecord(i, some_cats[i % 2], datetime(2021, 1, i + 1), f"Bulk {i}")
+            for i in range(10)
+        ]
+        records.append(ExpenseRecord(42, some_cats[2]))
+        exps = exp_model.add_expenses(records)
+        assert len(exps) == 11
+        assert exps[3].amount == 3
+        assert exps[3].expense_date == datetime(2021, 1, 4)
+        assert exps[3].comment == "Bulk 3"
+        assert exps[3].get_category() == some_cats[1]
+        assert exps[10].comment == ""
+        assert exp_model.get_expenses_by_ids([e.id for e in exps]) == exps
+
+    def test_add_expenses_ids_only(self, exp_model, some_cats):
+        records = [ExpenseRecord(i, some_cats[0]) for i in range(1000)]
+        ids = exp_model.add_expenses(records, build_expenses=False)
+        assert len(set(ids)) == 1000
+        exps = exp_model.get_expenses_by_ids(ids)
+        assert [e.amount for e in exps] == list(range(1000))
+
+    def test_add_expenses_fails_with_wrong_category(self, exp_model, cat_model):
+        c = cat_model.add_category("name")
+        records = [ExpenseRecord(1, replace(c))]
+        c.delete()
+        with pytest.raises(NoDataError):
+            exp_model.add_expenses(records)
+
     def test_delete_expense(self, exp_model, some_cats):
         e1 = exp_model.add_expense(123, some_cats[0])
         e1id = e1.id
@@ -297,6 +510,76 @@ class TestExpense:
         with pytest.raises(NoDataError):
             exp_model.get_expense_by_id(e1id)
 
+    def test_delete_expenses(self, exp_model, some_cats):
+        exps = [exp_model.add_expense(i, some_cats[0]) for i in range(3)]
+        ids = [e.id for e in exps]
+        exp_model.delete_expenses(exps)
+        assert all(e.id is None for e in exps)
+        for id in ids:
+            with pytest.raises(NoDataError):
+                exp_model.get_expense_by_id(id)
+
+    def test_delete_expenses_by_ids(self, exp_model, some_cats, not_delete_expense):
+        ids = exp_model.add_expenses(
+            [ExpenseRecord(i, some_cats[0]) for i in range(1500)], build_expenses=False
+        )
+        assert exp_model.delete_expenses_by_ids(ids + ids[:5]) == 1500
+        assert exp_model.delete_expenses_by_ids(ids) == 0
+        with pytest.raises(NoDataError) as e:
+            exp_model.get_expenses_by_ids(ids[:10] + [not_delete_expense.id])
+        assert e.value.args[1] == [not_delete_expense]
+
+    def test_update_expenses(self, exp_model, some_cats, not_delete_expense):
+        ids = exp_model.add_expenses(
+            [ExpenseRecord(i, some_cats[0]) for i in range(1200)], build_expenses=False
+        )
+        updated = exp_model.update_expenses(
+            ids,
+            {
+                ExpenseField.amount: 5,
+                ExpenseField.category: some_cats[2],
+                ExpenseField.expense_date: datetime(2019, 5, 6, 7, 8),
+                "comment": "bulk updated",
+            },
+        )
+        assert updated == 1200
+        for exp in exp_model.get_expenses_by_ids(ids[::100]):
+            assert exp.amount == 5
+            assert exp.get_category() == some_cats[2]
+            assert exp.expense_date == datetime(2019, 5, 6, 7, 8)
+            assert exp.comment == "bulk updated"
+        assert exp_model.get_expense_by_id(not_delete_expense.id) == not_delete_expense
+        assert exp_model.update_expenses(ids, {}) == 0
+
+    def test_update_expenses_fails(self, exp_model, some_expenses, cat_model):
+        ids = [e.id for e in some_expenses]
+        with pytest.raises(PrimaryKeyAssignmentError):
+            exp_model.update_expenses(ids, {"id": 2})
+        c = cat_model.add_category("name")
+        ghost = replace(c)
+        c.delete()
+        with pytest.raises(NoDataError):
+            exp_model.update_expenses(ids, {ExpenseField.category: ghost})
+        assert exp_model.get_expenses_by_ids(ids) == some_expenses
+
+    def test_expenses_know_category(self, exp_model, some_cats, cat_model):
+        e1 = exp_model.add_expense(1, some_cats[0])
+        assert (e1.category_id, e1.category_name) == (some_cats[0].id, "Category 0")
+        e1.set_attribute("category", some_cats[1])
+        assert (e1.category_id, e1.category_name) == (some_cats[1].id, "Category 1")
+        assert exp_model.get_expense_by_id(e1.id) == e1
+        cat = cat_model.add_category("Known category")
+        (e2,) = exp_model.add_expenses([ExpenseRecord(2, cat)])
+        assert e2.category_name == "Known category"
+        exp_model.add_expense(3, cat)
+        exps = exp_model.get_expenses_by_constraints(
+            [ExpenseConstraint(ExpenseField.category, ConstraintType.equal, cat)]
+        )
+        assert len(exps) == 2
+        assert {(e.category_id, e.category_name) for e in exps} == {
+            (cat.id, "Known category")
+        }
+
     def test_get_expense_by_id(self, exp_model, not_delete_expense):
         ndeid = not_delete_expense.id
         assert exp_model.get_expense_by_id(ndeid) == not_delete_expense
@@ -321,6 +604,16 @@ class TestExpense:
             exp_got = e.args[1]
             assert exp_got == some_expenses
 
+    def test_get_expenses_by_ids_keeps_order(self, exp_model, some_cats):
+        # more ids than fit in one SQLite query
+        ids = exp_model.add_expenses(
+            [ExpenseRecord(i, some_cats[4]) for i in range(2500)], build_expenses=False
+        )
+        ids.reverse()
+        exp_got = exp_model.get_expenses_by_ids(ids + ids[:3])
+        assert [e.id for e in exp_got] == ids + ids[:3]
+        assert [e.amount for e in exp_got[:3]] == [2499, 2498, 2497]
+
     def test_set_attributes_from_expense(self, exp_model, some_cats):
         e1 = exp_model.add_expense(
             321,
@@ -480,6 +773,97 @@ class TestExpense:
                 ]
             )
 
+    def test_get_expenses_by_constraint_subtree(self, exp_model, cat_model, cat_tree):
+        (c0, c05, c1, c2) = cat_tree
+        other = cat_model.add_category("Not in subtree")
+        exps = exp_model.add_expenses(
+            [
+                ExpenseRecord(1, c1[0], datetime(1970, 1, 1)),
+                ExpenseRecord(2, c2[0][1], datetime(1970, 1, 2)),
+                ExpenseRecord(3, c2[4][4], datetime(1970, 1, 3)),
+                ExpenseRecord(4, c2[4][4], datetime(1971, 1, 3)),
+                ExpenseRecord(5, c0, datetime(1970, 1, 4)),
+                ExpenseRecord(6, other, datetime(1970, 1, 5)),
+            ]
+        )
+        in_c05 = ExpenseConstraint(
+            ExpenseField.category, ConstraintType.in_subtree, c05
+        )
+        assert exp_model.get_expenses_by_constraints([in_c05]) == exps[3::-1]
+        assert exp_model.get_expenses_by_constraints(
+            [
+                in_c05,
+                ExpenseConstraint(
+                    ExpenseField.expense_date, ConstraintType.less, datetime(1971, 1, 1)
+                ),
+                ExpenseConstraint(ExpenseField.amount, ConstraintType.geq, 2),
+            ]
+        ) == exps[2:0:-1]
+        in_leaf = ExpenseConstraint(
+            ExpenseField.category, ConstraintType.in_subtree, c2[4][4]
+        )
+        assert exp_model.get_expenses_by_constraints([in_leaf]) == exps[3:1:-1]
+
+    def test_subtree_constraint_fails_for_other_fields(self, exp_model):
+        with pytest.raises(ConstraintError):
+            exp_model.get_expenses_by_constraints(
+                [ExpenseConstraint(ExpenseField.amount, ConstraintType.in_subtree, 1)]
+            )
+
+    def test_get_expenses_by_constraint_comment_search(self, exp_model, cat_model):
+        cat = cat_model.add_category("Search")
+        exps = exp_model.add_expenses(
+            [
+                ExpenseRecord(1, cat, datetime(1960, 1, 1), "Pharmacy: aspirin"),
+                ExpenseRecord(2, cat, datetime(1960, 1, 2), "pharmacy near home"),
+                ExpenseRecord(3, cat, datetime(1960, 1, 3), "pharmacist advice"),
+                ExpenseRecord(4, cat, datetime(1960, 1, 4), "groceries"),
+            ]
+        )
+        in_cat = ExpenseConstraint(ExpenseField.category, ConstraintType.equal, cat)
+        match = ExpenseConstraint(ExpenseField.comment, ConstraintType.match, "pharmacy")
+        assert exp_model.get_expenses_by_constraints([in_cat, match]) == exps[1::-1]
+        prefix = ExpenseConstraint(ExpenseField.comment, ConstraintType.prefix, "pharm")
+        assert exp_model.get_expenses_by_constraints([in_cat, prefix]) == exps[2::-1]
+        several = ExpenseConstraint(
+            ExpenseField.comment, ConstraintType.match, "home PHARMACY"
+        )
+        assert exp_model.get_expenses_by_constraints([several]) == exps[1:2]
+        nothing = ExpenseConstraint(ExpenseField.comment, ConstraintType.match, " ")
+        assert exp_model.get_expenses_by_constraints([in_cat, nothing]) == []
+        # FTS5 syntax is taken literally
+        syntax = ExpenseConstraint(ExpenseField.comment, ConstraintType.match, 'a" OR')
+        assert exp_model.get_expenses_by_constraints([in_cat, syntax]) == []
+
+    def test_comment_search_follows_changes(self, exp_model, some_cats):
+        exp = exp_model.add_expense(1, some_cats[0], comment="unique xylophone")
+        assert exp_model.search_expenses("xylophone") == [exp]
+        exp.set_attribute("comment", "unique trombone")
+        assert exp_model.search_expenses("xylophone") == []
+        assert exp_model.search_expenses("trombone") == [exp]
+        exp.delete()
+        assert exp_model.search_expenses("trombone") == []
+
+    def test_search_expenses(self, exp_model, cat_model):
+        cat = cat_model.add_category("Ranked search")
+        exps = exp_model.add_expenses(
+            [
+                ExpenseRecord(
+                    1, cat, datetime(1961, 1, 1), "zebra bought at zoo shop, many words"
+                ),
+                ExpenseRecord(2, cat, datetime(1961, 1, 2), "zebra zebra"),
+                ExpenseRecord(3, cat, datetime(1961, 1, 3), "zebrafish"),
+            ]
+        )
+        # More relevant goes first
+        assert exp_model.search_expenses("zebra") == exps[1::-1]
+        assert exp_model.search_expenses("zebra", max_num=1) == exps[1:2]
+        assert set(exp_model.search_expenses("zebra", prefix=True)) == set(exps)
+        assert exp_model.search_expenses(
+            "zebra",
+            [ExpenseConstraint(ExpenseField.amount, ConstraintType.less, 2)],
+        ) == exps[:1]
+
     def test_get_expenses_by_constraint_many(
         self, exp_model, expenses_for_test, cat_to_find
     ):
@@ -495,6 +879,142 @@ class TestExpense:
             )
         ) == set(expenses_for_test)
 
+    def test_get_expenses_by_constraint_neq(self, exp_model, expenses_for_test):
+        assert set(
+            exp_model.get_expenses_by_constraints(
+                [
+                    ExpenseConstraint(ExpenseField.amount, ConstraintType.geq, 700700),
+                    ExpenseConstraint(ExpenseField.amount, ConstraintType.neq, 700701),
+                ]
+            )
+        ) == set(expenses_for_test[:1] + expenses_for_test[2:])
+
+    def test_get_expenses_by_constraint_max_num(self, exp_model, expenses_for_test):
+        exps = exp_model.get_expenses_by_constraints(
+            [ExpenseConstraint(ExpenseField.amount, ConstraintType.geq, 700700)],
+            max_num=2,
+        )
+        # Sorted by expense_date descending
+        assert exps == expenses_for_test[:2:-1]
+
+    def test_iter_expenses_by_constraints(self, exp_model, cat_model):
+        cat = cat_model.add_category("Category for iteration")
+        exp_model.add_expenses(
+            [ExpenseRecord(i, cat, datetime(2011, 1, 1 + i // 4)) for i in range(30)]
+        )
+        constraints = [
+            ExpenseConstraint(ExpenseField.category, ConstraintType.equal, cat),
+            ExpenseConstraint(ExpenseField.amount, ConstraintType.geq, 3),
+        ]
+        expected = exp_model.get_expenses_by_constraints(constraints)
+        assert len(expected) == 27
+        for chunk_size in (1, 7, 27, 100):
+            got = exp_model.iter_expenses_by_constraints(constraints, chunk_size)
+            assert list(got) == expected
+
+    def test_iter_expenses_by_constraints_fails(self, exp_model, cat_to_find):
+        with pytest.raises(ConstraintError):
+            exp_model.iter_expenses_by_constraints(
+                [
+                    ExpenseConstraint(
+                        ExpenseField.category, ConstraintType.leq, cat_to_find
+                    )
+                ]
+            )
+        for chunk_size in (0, -1):
+            with pytest.raises(ValueError):
+                exp_model.iter_expenses_by_constraints([], chunk_size)
+
+    def test_get_expenses_page(self, exp_model, cat_model):
+        cat = cat_model.add_category("Category for pages")
+        # Some expenses share the same date, so id decides the order
+        ids = exp_model.add_expenses(
+            [ExpenseRecord(i, cat, datetime(2010, 1, 1 + i // 3)) for i in range(25)],
+            build_expenses=False,
+        )
+        constraints = [
+            ExpenseConstraint(ExpenseField.category, ConstraintType.equal, cat)
+        ]
+        got = []
+        cursor = None
+        pages = 0
+        while True:
+            page = exp_model.get_expenses_page(constraints, 4, cursor)
+            got.extend(page.expenses)
+            pages += 1
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        assert pages == 7
+        assert [e.id for e in got] == ids[::-1]
+
+    def test_expenses_carry_category_label(self, exp_model, cat_model):
+        top = cat_model.add_category("label top")
+        sub = cat_model.add_category("label sub", parent=top)
+        added = exp_model.add_expense(1, sub, datetime(1950, 1, 1))
+        assert added.category_label == "label top > label sub"
+        cat_model.update_category(top, {CategoryField.name: "label root"})
+        constraints = [
+            ExpenseConstraint(ExpenseField.category, ConstraintType.equal, sub)
+        ]
+        page = exp_model.get_expenses_page(constraints, page_size=10)
+        assert [e.category_label for e in page.expenses] == [
+            "label root > label sub"
+        ]
+        added.set_attribute(ExpenseField.category, top)
+        assert added.category_label == "label root"
+        # Label written by trigger is read back within the same session
+        with db_session:
+            leaf = cat_model.add_category("label leaf", parent=sub)
+            added = exp_model.add_expense(1, leaf, datetime(1950, 1, 1))
+        assert added.category_label == "label root > label sub > label leaf"
+
+    def test_get_expenses_page_exact_size(self, exp_model, cat_model):
+        cat = cat_model.add_category("Category for exact page")
+        exp_model.add_expenses([ExpenseRecord(i, cat) for i in range(4)])
+        constraints = [
+            ExpenseConstraint(ExpenseField.category, ConstraintType.equal, cat)
+        ]
+        page = exp_model.get_expenses_page(constraints, 4)
+        assert len(page.expenses) == 4
+        assert page.next_cursor is None
+
+    def test_get_expenses_page_wrong_cursor(self, exp_model):
+        with pytest.raises(ValueError):
+            exp_model.get_expenses_page([], 4, "not a cursor")
+
+    def test_get_expenses_page_wrong_size(self, exp_model):
+        for page_size in (0, -1):
+            with pytest.raises(ValueError):
+                exp_model.get_expenses_page([], page_size)
+
+    def test_expenses_page_uses_index(self, exp_model):
+        sql, params = exp_model._form_select_sql(
+            [], 101, after=(datetime(2010, 1, 1), 1000)
+        )
+        with db_session:
+            plan = exp_model.db.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+        details = " ".join(row[-1] for row in plan)
+        assert "USING INDEX idx_expense__expense_date (expense_date<?)" in details
+        assert "TEMP B-TREE" not in details
+
+    def test_date_range_constraint_uses_index(self, exp_model):
+        sql, params = exp_model._form_select_sql(
+            [
+                ExpenseConstraint(
+                    ExpenseField.expense_date, ConstraintType.geq, datetime(2001, 1, 1)
+                ),
+                ExpenseConstraint(
+                    ExpenseField.expense_date, ConstraintType.less, datetime(2002, 1, 1)
+                ),
+            ]
+        )
+        with db_session:
+            plan = exp_model.db.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+        details = " ".join(row[-1] for row in plan)
+        assert "USING INDEX idx_expense__expense_date (expense_date>? AND" in details
+        assert "SCAN e\n" not in details + "\n"
+
     def test_get_expense_amount_by_time_period(
             self, exp_model, expenses_for_test
     ):
@@ -502,6 +1022,184 @@ class TestExpense:
             datetime(2000, 1, 1, 12, 0), datetime(2002, 3, 3, 12, 0)
         ) == 700700*3 + 3
 
+    def test_get_expense_amounts_by_time_periods(self, exp_model, expenses_for_test):
+        periods = [
+            (datetime(2000, 1, 1, 12, 0), datetime(2002, 3, 3, 12, 0)),
+            (datetime(2001, 1, 1), datetime(2004, 12, 31)),
+            (datetime(1000, 1, 1), datetime(1000, 1, 2)),
+        ]
+        assert exp_model.get_expense_amounts_by_time_periods(periods) == [
+            exp_model.get_expense_amount_by_time_period(*period) for period in periods
+        ]
+        assert exp_model.get_expense_amounts_by_time_periods(periods)[2] == 0
+        assert exp_model.get_expense_amounts_by_time_periods([]) == []
+
+    def test_time_periods_sum_uses_index(self, exp_model):
+        # Spent budget periods: day, week and month, with partial days
+        sql, params = exp_model._form_periods_sum_sql(
+            [
+                (datetime(2024, 5, 15), datetime(2024, 5, 15, 23, 59, 59, 999999)),
+                (datetime(2024, 5, 13, 12, 0), datetime(2024, 5, 15, 18, 0)),
+                (datetime(2024, 5, 1), datetime(2024, 5, 15, 18, 0)),
+            ]
+        )
+        with db_session:
+            plan = exp_model.db.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+        details = [row[-1] for row in plan]
+        # Every period reads only its own range, no table is scanned
+        assert not any(
+            detail.startswith(("SCAN Expense", "SCAN DailyTotal")) for detail in details
+        )
+        assert sum("SEARCH DailyTotal" in detail for detail in details) == 3
+
+    def test_amount_by_time_period_with_partial_days(self, exp_model, cat_model):
+        cat = cat_model.add_category("Partial days")
+        exp_model.add_expenses(
+            [
+                ExpenseRecord(1, cat, datetime(1970, 6, 1, 9)),
+                ExpenseRecord(2, cat, datetime(1970, 6, 1, 15)),
+                ExpenseRecord(4, cat, datetime(1970, 6, 2, 12)),
+                ExpenseRecord(8, cat, datetime(1970, 6, 3)),
+                ExpenseRecord(16, cat, datetime(1970, 6, 3, 10, 30)),
+            ]
+        )
+        amount = exp_model.get_expense_amount_by_time_period
+        assert amount(datetime(1970, 6, 1, 12), datetime(1970, 6, 3, 10)) == 14
+        assert amount(datetime(1970, 6, 1), datetime(1970, 6, 2, 23, 59, 59)) == 7
+        assert amount(datetime(1970, 6, 1, 9), datetime(1970, 6, 1, 15)) == 3
+        assert amount(
+            datetime(1970, 6, 1), datetime.combine(datetime(1970, 6, 3), time.max)
+        ) == 31
+
+    def test_daily_totals_follow_expense_writes(self, exp_model, cat_model):
+        cat = cat_model.add_category("Daily totals")
+        other = cat_model.add_category("Daily totals other")
+
+        def daily_totals():
+            with db_session:
+                return sorted(
+                    exp_model.db.select(
+                        'SELECT "date", "category", "amount" FROM "DailyTotal" '
+                        'WHERE "category" IN ($cat, $other)',
+                        {"cat": cat.id, "other": other.id},
+                    )
+                )
+
+        exp = exp_model.add_expense(1, cat, datetime(1960, 1, 1, 10))
+        ids = exp_model.add_expenses(
+            [
+                ExpenseRecord(2, cat, datetime(1960, 1, 1, 20)),
+                ExpenseRecord(4, cat, datetime(1960, 1, 2)),
+            ],
+            build_expenses=False,
+        )
+        assert daily_totals() == [("1960-01-01", cat.id, 3), ("1960-01-02", cat.id, 4)]
+        exp_model.set_attributes(exp, {ExpenseField.category: other})
+        exp_model.update_expenses(ids[1:], {ExpenseField.amount: 5})
+        assert daily_totals() == [
+            ("1960-01-01", cat.id, 2),
+            ("1960-01-01", other.id, 1),
+            ("1960-01-02", cat.id, 5),
+        ]
+        exp_model.update_expenses(ids, {ExpenseField.expense_date: datetime(1960, 1, 3)})
+        exp_model.delete_expense(exp)
+        assert daily_totals() == [("1960-01-03", cat.id, 7)]
+        cat_model.delete_category(cat)
+        assert daily_totals() == []
+
+    def test_month_sum_reads_daily_totals(self, exp_model):
+        source, params = exp_model._period_source_sql(
+            datetime(2020, 2, 1), datetime(2020, 2, 29, 23, 59, 59, 999999)
+        )
+        # The whole month is covered by days, raw expenses are read only for edges
+        assert (params["first_day"], params["last_day"]) == ("2020-02-01", "2020-02-29")
+        with db_session:
+            plan = exp_model.db.execute(
+                f"EXPLAIN QUERY PLAN SELECT SUM(amount) FROM ({source})", params
+            ).fetchall()
+        details = " ".join(row[-1] for row in plan)
+        assert "SEARCH DailyTotal USING PRIMARY KEY (date>? AND date<?)" in details
+        assert "SCAN Expense" not in details
+
+    def test_get_expense_totals_by_category(self, exp_model, cat_model, some_cats):
+        root = cat_model.add_category("Totals root")
+        child = cat_model.add_category("Totals child", parent=root)
+        grandchild = cat_model.add_category("Totals grandchild", parent=child)
+        other = cat_model.add_category("Totals other")
+        exp_model.add_expenses(
+            [
+                ExpenseRecord(1, root, datetime(1990, 1, 1)),
+                ExpenseRecord(10, child, datetime(1990, 1, 2)),
+                ExpenseRecord(20, child, datetime(1990, 1, 3)),
+                ExpenseRecord(100, grandchild, datetime(1990, 1, 31, 23, 59)),
+                ExpenseRecord(1000, other, datetime(1990, 1, 15)),
+                ExpenseRecord(5000, other, datetime(1990, 2, 1)),
+            ]
+        )
+        start, end = datetime(1990, 1, 1), datetime(1990, 1, 31, 23, 59)
+        totals = exp_model.get_expense_totals_by_category(start, end)
+        assert totals == {root.id: 1, child.id: 30, grandchild.id: 100, other.id: 1000}
+        totals = exp_model.get_expense_totals_by_category(start, end, rollup=True)
+        assert totals[root.id] == 131
+        assert totals[child.id] == 130
+        assert totals[grandchild.id] == 100
+        assert totals[other.id] == 1000
+        assert totals[some_cats[0].id] == 0
+
+    def test_get_expense_totals_by_category_for_days(self, exp_model, cat_model):
+        root = cat_model.add_category("Days totals root")
+        child = cat_model.add_category("Days totals child", parent=root)
+        exp_model.add_expenses(
+            [
+                ExpenseRecord(1, root, datetime(1950, 3, 1, 10)),
+                ExpenseRecord(2, child, datetime(1950, 3, 10)),
+                ExpenseRecord(4, child, datetime(1950, 3, 31, 23)),
+                ExpenseRecord(8, child, datetime(1950, 4, 1)),
+            ]
+        )
+        periods = [
+            (date(1950, 3, 31), date(1950, 3, 31)),
+            (date(1950, 3, 1), date(1950, 3, 31)),
+            (date(1950, 3, 1), date(1950, 4, 30)),
+        ]
+        totals = exp_model.get_expense_totals_by_category_for_days(periods)
+        assert totals == {root.id: [0, 1, 1], child.id: [4, 6, 14]}
+        totals = exp_model.get_expense_totals_by_category_for_days(periods, rollup=True)
+        assert totals[root.id] == [4, 7, 15]
+        assert totals[child.id] == [4, 6, 14]
+        assert exp_model.get_expense_totals_by_category_for_days([]) == {}
+
+    def test_get_expense_series(self, exp_model, cat_model):
+        cat = cat_model.add_category("Series")
+        other = cat_model.add_category("Series other")
+        exp_model.add_expenses(
+            [
+                # 1980-03-02 is sunday, 1980-03-03 is monday
+                ExpenseRecord(1, cat, datetime(1980, 3, 2, 23, 59)),
+                ExpenseRecord(2, cat, datetime(1980, 3, 3)),
+                ExpenseRecord(4, other, datetime(1980, 3, 3, 10)),
+                ExpenseRecord(8, cat, datetime(1980, 3, 9, 12)),
+                ExpenseRecord(16, cat, datetime(1980, 5, 20)),
+            ]
+        )
+        start, end = datetime(1980, 3, 1), datetime(1980, 5, 31, 23, 59)
+        days = exp_model.get_expense_series(start, end, "day")
+        assert len(days) == 92
+        assert days[:10] == [0, 1, 6, 0, 0, 0, 0, 0, 8, 0]
+        assert days[80] == 16
+        assert sum(days) == 31
+        weeks = exp_model.get_expense_series(start, end, SeriesBucket.week)
+        # Week of 1980-02-25 .. 1980-03-02 is the first one
+        assert len(weeks) == 14
+        assert weeks[:3] == [1, 14, 0]
+        assert weeks[12] == 16
+        months = exp_model.get_expense_series(start, end, "month", category=cat)
+        assert months == [11, 0, 16]
+        months = exp_model.get_expense_series(
+            datetime(1979, 11, 5), datetime(1980, 2, 1), "month"
+        )
+        assert months == [0, 0, 0, 0]
+
     # def test_get_parent(self, cat_model):
     #     c1 = cat_model.add_category('parent')
     #     c2 = cat_model.add_category('name', parent=c1)
@@ -511,3 +1209,242 @@ class TestExpense:
     #     c1 = cat_model.add_category('parent')
     #     children = [cat_model.add_category(f"child{i}", parent=c1) for i in range(5)]
     #     assert set(c1.get_children()) == set(children)
+
+
+class TestBudget:
+    def test_update_spent_budget(self, budget_model, exp_model, some_cats):
+        now = datetime.now()
+        exp_model.add_expense(10, some_cats[0], now)
+        exp_model.add_expense(1000, some_cats[0], now - timedelta(days=400))
+        budget_model.update_spent_budget()
+        spent = budget_model.get_spent_budget()
+        end_of_day = datetime.combine(now, time.max)
+        start_of_day = datetime.combine(now, time.min)
+        start_of_week = start_of_day - timedelta(days=now.weekday())
+        assert spent.daily == exp_model.get_expense_amount_by_time_period(
+            start_of_day, end_of_day
+        )
+        assert spent.weekly == exp_model.get_expense_amount_by_time_period(
+            start_of_week, end_of_day
+        )
+        assert spent.monthly == exp_model.get_expense_amount_by_time_period(
+            start_of_day.replace(day=1), end_of_day
+        )
+        assert spent.daily >= 10
+
+    def test_spent_budget_follows_expense_changes(self, budget_model, exp_model):
+        cat = exp_model.model.category_model.add_category("spent_deltas")
+        budget_model.update_spent_budget()
+        before = budget_model.get_spent_budget()
+        now = datetime.now()
+        exp = exp_model.add_expense(5, cat, now)
+        exp_model.add_expense(7, cat, now + timedelta(days=40))
+        ids = exp_model.add_expenses(
+            [ExpenseRecord(3, cat, now), ExpenseRecord(4, cat, now)],
+            build_expenses=False,
+        )
+        assert budget_model.get_spent_budget().daily == pytest.approx(before.daily + 12)
+        exp_model.set_attributes(exp, {ExpenseField.amount: 6})
+        exp_model.update_expenses(ids, {ExpenseField.expense_date: now - timedelta(400)})
+        spent = budget_model.get_spent_budget()
+        assert spent.daily == pytest.approx(before.daily + 6)
+        assert spent.monthly == pytest.approx(before.monthly + 6)
+        exp_model.delete_expenses_by_ids([exp.id])
+        assert budget_model.get_spent_budget().daily == pytest.approx(before.daily)
+        # Incremental figures agree with full recompute
+        assert not budget_model.update_spent_budget()
+
+    def test_spent_budget_recomputed_on_rollover(self, budget_model, exp_model):
+        cat = exp_model.model.category_model.add_category("spent_rollover")
+        exp_model.add_expense(8, cat, datetime.now())
+        budget_model.update_spent_budget()
+        expected = budget_model.get_spent_budget()
+        with db_session:
+            budget_model.db.Budget[expected.id].daily = -1
+        budget_model._spent_periods = budget_model._form_spent_periods(
+            datetime.now() - timedelta(days=1)
+        )
+        assert budget_model.get_spent_budget().daily == expected.daily
+
+    def test_get_all_budgets(self, budget_model):
+        added = [
+            budget_model.add_budget(f"person{i}", i, 10 * i, 100 * i) for i in range(3)
+        ]
+        budgets = {b.id: b for b in budget_model.get_all_budgets()}
+        assert budget_model.get_spent_budget().id in budgets
+        for budget in added:
+            assert budgets[budget.id] == budget
+        assert budget_model.get_budgets_by_ids([b.id for b in added]) == added
+
+    def test_exceed_check_loads_spent_budget_once(self, budget_model, monkeypatch):
+        ids = [budget_model.add_budget(f"project{i}", 0, 0, 1e9).id for i in range(5)]
+        calls = []
+        get_budget_spent = budget_model._get_budget_spent
+
+        def counting_get_budget_spent():
+            calls.append(1)
+            return get_budget_spent()
+
+        monkeypatch.setattr(budget_model, "_get_budget_spent", counting_get_budget_spent)
+        budgets = budget_model.get_budgets_by_ids(ids)
+        assert len(calls) == 1
+        spent = budget_model.get_spent_budget()
+        assert all(
+            b.exceeded == [spent.daily <= 0, spent.weekly <= 0, True] for b in budgets
+        )
+
+    def test_category_budgets(self, budget_model, exp_model, monkeypatch):
+        cat_model = exp_model.model.category_model
+        root = cat_model.add_category("Budget root")
+        child = cat_model.add_category("Budget child", parent=root)
+        other = cat_model.add_category("Budget other")
+        now = datetime.now()
+        exp_model.add_expense(10, root, now)
+        exp_model.add_expense(20, child, now)
+        exp_model.add_expense(40, other, now)
+        exp_model.add_expense(80, child, now - timedelta(days=400))
+        root_budget = budget_model.add_budget("root limit", 25, 1000, 1000, root)
+        child_budget = budget_model.add_budget("child limit", 25, 1000, 1000, child)
+        assert root_budget.category_id == root.id
+        assert root_budget.spent == [30, 30, 30]
+        assert root_budget.exceeded == [False, True, True]
+        assert child_budget.spent == [20, 20, 20]
+        assert child_budget.exceeded == [True, True, True]
+
+        calls = []
+        totals_for_days = exp_model.get_expense_totals_by_category_for_days
+
+        def counting_totals_for_days(*args, **kwargs):
+            calls.append(1)
+            return totals_for_days(*args, **kwargs)
+
+        monkeypatch.setattr(
+            exp_model, "get_expense_totals_by_category_for_days", counting_totals_for_days
+        )
+        budgets = {b.id: b for b in budget_model.get_all_budgets()}
+        assert len(calls) == 1
+        assert budgets[root_budget.id] == root_budget
+        assert budgets[child_budget.id] == child_budget
+        assert budgets[budget_model.get_spent_budget().id].category_id is None
+        # Budgets of deleted category are deleted too
+        cat_model.delete_category(child)
+        with pytest.raises(NoDataError):
+            budget_model.get_budget_by_id(child_budget.id)
+
+    def test_spent_periods_cached_until_rollover(self, budget_model, monkeypatch):
+        rollover = budget_model.get_spent_rollover()
+        tomorrow = datetime.combine(datetime.now().date(), time.min) + timedelta(1)
+        assert rollover == tomorrow
+        calls = []
+        form_spent_periods = budget_model._form_spent_periods
+
+        def counting_form_spent_periods(now):
+            calls.append(now)
+            return form_spent_periods(now)
+
+        monkeypatch.setattr(
+            budget_model, "_form_spent_periods", counting_form_spent_periods
+        )
+        budget_model.update_spent_budget()
+        budget_model.get_spent_budget()
+        assert calls == []
+        # The day is over
+        budget_model._spent_periods = form_spent_periods(datetime.now() - timedelta(1))
+        budget_model.update_spent_budget()
+        assert len(calls) == 1
+        assert budget_model.get_spent_rollover() == rollover
+
+    def test_update_spent_budget_detects_drift(self, budget_model):
+        budget_model.update_spent_budget()
+        spent = budget_model.get_spent_budget()
+        with db_session:
+            budget_model.db.Budget[spent.id].weekly += 1
+        assert budget_model.update_spent_budget()
+        assert budget_model.get_spent_budget().weekly == spent.weekly
+
+
+@pytest.fixture
+def old_database_file(tmp_path) -> str:
+    """Database created before secondary indexes were declared"""
+    filename = str(tmp_path / "old.sqlite")
+    con = sqlite3.connect(filename)
+    con.executescript(
+        """
+        CREATE TABLE "Category" (
+          "id" INTEGER PRIMARY KEY AUTOINCREMENT,
+          "name" TEXT NOT NULL,
+          "parent" INTEGER REFERENCES "Category" ("id") ON DELETE SET NULL
+        );
+        CREATE TABLE "Budget" (
+          "id" INTEGER PRIMARY KEY AUTOINCREMENT,
+          "preset" TEXT UNIQUE NOT NULL,
+          "daily" REAL,
+          "weekly" REAL,
+          "monthly" REAL
+        );
+        CREATE TABLE "Expense" (
+          "id" INTEGER PRIMARY KEY AUTOINCREMENT,
+          "amount" REAL NOT NULL,
+          "category" INTEGER NOT NULL REFERENCES "Category" ("id") ON DELETE CASCADE,
+          "expense_date" DATETIME NOT NULL,
+          "added_date" DATETIME NOT NULL,
+          "comment" TEXT NOT NULL
+        );
+        INSERT INTO "Category" ("name") VALUES ('old');
+        INSERT INTO "Expense" VALUES
+          (1, 10, 1, '2020-01-01 00:00:00.000000', '2020-01-01 00:00:00.000000',
+           'old pharmacy receipt');
+        """
+    )
+    con.close()
+    return filename
+
+
+def test_indexes_created_in_existing_database(old_database_file):
+    model = PonyModel(provider="sqlite", filename=old_database_file)
+    with db_session:
+        indexes = set(
+            model.db.select("name FROM sqlite_master WHERE type = 'index'")
+        )
+    assert {
+        "idx_category__parent",
+        "idx_expense__expense_date",
+        "idx_expense__category_expense_date",
+    } <= indexes
+    assert model.expenses_model.get_expense_by_id(1).amount == 10
+    # Comments of existing expenses are indexed for full-text search
+    assert [e.id for e in model.expenses_model.search_expenses("pharmacy")] == [1]
+    # Daily totals are filled from existing expenses
+    assert model.expenses_model.get_expense_amount_by_time_period(
+        datetime(2020, 1, 1), datetime(2020, 1, 1, 23, 59, 59, 999999)
+    ) == 10
+    with db_session:
+        assert model.db.select('SELECT "amount" FROM "DailyTotal"') == [10]
+    # Ancestry of existing categories is filled
+    with db_session:
+        assert model.db.select(
+            'SELECT "ancestor", "descendant", "depth" FROM "CategoryClosure"'
+        ) == [(1, 1, 0)]
+    # Paths and labels of existing categories are filled
+    with db_session:
+        assert model.db.select('SELECT "path", "label" FROM "Category"') == [
+            ("/1/", "old")
+        ]
+    assert model.expenses_model.get_expense_by_id(1).category_label == "old"
+    # Budgets table gets category column
+    old_category = model.category_model.get_category_by_id(1)
+    budget = model.budget_model.add_budget("old category", 1, 2, 3, old_category)
+    assert model.budget_model.get_budget_by_id(budget.id).category_id == 1
+
+
+def test_category_constraint_uses_composite_index(exp_model, some_cats):
+    sql, params = exp_model._form_select_sql(
+        [ExpenseConstraint(ExpenseField.category, ConstraintType.equal, some_cats[0])],
+        max_num=100,
+    )
+    with db_session:
+        plan = exp_model.db.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    details = " ".join(row[-1] for row in plan)
+    assert "USING INDEX idx_expense__category_expense_date (category=?)" in details
+    # ORDER BY expense_date is served by index too
+    assert "TEMP B-TREE" not in details
@@ -0,0 +1,122 @@
+from datetime import datetime
+
+import pytest
+
+from bookkeeper.core import CategoryDeletePolicy, ExpensesHandlingPolicy
+from bookkeeper.models.pony_models.pony_model import PonyModel
+from bookkeeper.presenter import Presenter
+
+
+class FakeView:
+    """
+    View keeping shown data in memory, handlers are stored by their names
+    """
+
+    def __init__(self):
+        self.handlers = {}
+        self.categories = []
+        self.expenses = {}
+        self.budgets = {}
+        self.budget_refreshes = 0
+        self.scheduled = []
+
+    def __getattr__(self, name):
+        if name.startswith("register_") and name.endswith("_handler"):
+            handler_name = name[len("register_"):-len("_handler")]
+            return lambda handler: self.handlers.__setitem__(handler_name, handler)
+        raise AttributeError(name)
+
+    def start(self):
+        pass
+
+    def refresh_expenses_table(self, expenses):
+        self.expenses = {e.id: e for e in expenses}
+
+    def update_expenses(self, expenses):
+        self.expenses.update({e.id: e for e in expenses})
+
+    def remove_expenses(self, expenses):
+        for id in expenses:
+            del self.expenses[id]
+
+    def expenses_shown(self):
+        return list(self.expenses.values())
+
+    def refresh_categories(self, categories):
+        self.categories = categories
+
+    def update_categories(self, categories):
+        self.categories += categories
+
+    def refresh_budgets(self, budgets):
+        self.budgets = {b.id: b for b in budgets}
+        self.budget_refreshes += 1
+
+    def update_budgets(self, budgets):
+        self.budgets.update({b.id: b for b in budgets})
+
+    def schedule(self, moment, handler):
+        self.scheduled.append((moment, handler))
+
+
+@pytest.fixture
+def model():
+    return PonyModel(provider="sqlite", filename=":memory:")
+
+
+@pytest.fixture
+def view():
+    return FakeView()
+
+
+def test_budgets_shown(view, model):
+    cat = model.category_model.add_category("food")
+    child = model.category_model.add_category("meat", cat)
+    sibling = model.category_model.add_category("books")
+    budget = model.budget_model.add_budget("food", 1, 2, 3, cat)
+    presenter = Presenter(view, model)
+    assert {b.caption for b in view.budgets.values()} == {"Spent", "Budget", "food"}
+    assert view.budgets.keys() == presenter.budgets_shown.keys()
+    # exceeded holds whether daily, weekly and monthly spendings are within limits
+    assert view.budgets[budget.id].exceeded == [True, True, True]
+    # Expenses of other categories are not counted
+    presenter.add_expense("10", sibling.id)
+    assert view.budgets[budget.id].exceeded == [True, True, True]
+    # Expenses of subcategories are counted
+    presenter.add_expense("10", child.id)
+    assert view.budgets[budget.id].exceeded == [False, False, False]
+
+
+def test_delete_category_with_budget(view, model):
+    cat = model.category_model.add_category("food")
+    budget = model.budget_model.add_budget("food", 1, 2, 3, cat)
+    presenter = Presenter(view, model)
+    assert budget.id in view.budgets
+    presenter.delete_category(
+        cat.id, CategoryDeletePolicy.delete, ExpensesHandlingPolicy.delete
+    )
+    assert [b.caption for b in view.budgets.values()] == ["Spent", "Budget"]
+    assert budget.id not in presenter.budgets_shown
+
+
+def test_spent_rollover_scheduled(view, model, monkeypatch):
+    Presenter(view, model)
+    [(moment, handler)] = view.scheduled
+    assert moment == model.budget_model.get_spent_rollover()
+    assert moment > datetime.now()
+    refreshes = view.budget_refreshes
+    # Called earlier than scheduled, the handler waits for the same moment
+    handler()
+    assert view.budget_refreshes == refreshes
+    assert view.scheduled[1:] == [(moment, handler)]
+
+    class Tomorrow(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return moment
+
+    monkeypatch.setattr("bookkeeper.presenter.datetime", Tomorrow)
+    handler()
+    assert view.budget_refreshes == refreshes + 1
+    assert len(view.scheduled) == 3
+    assert [b.caption for b in view.budgets.values()] == ["Spent", "Budget"]
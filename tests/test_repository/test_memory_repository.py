@@ -69,3 +69,36 @@ def test_get_all_with_condition(repo, custom_class):
         objects.append(o)
     assert repo.get_all({'name': '0'}) == [objects[0]]
     assert repo.get_all({'test': 'test'}) == objects
+
+
+@pytest.fixture
+def indexed_repo():
+    return MemoryRepository(indexed=['name'])
+
+
+def test_get_all_with_index(indexed_repo, custom_class):
+    objects = []
+    for i in range(6):
+        o = custom_class()
+        o.name = str(i % 2)
+        o.test = str(i % 3)
+        indexed_repo.add(o)
+        objects.append(o)
+    assert indexed_repo.get_all({'name': '0'}) == objects[::2]
+    assert indexed_repo.get_all({'test': '0', 'name': '1'}) == [objects[3]]
+    assert indexed_repo.get_all({'name': '2'}) == []
+
+    moved = custom_class()
+    moved.pk = objects[0].pk
+    moved.name = '1'
+    moved.test = '0'
+    indexed_repo.update(moved)
+    # Objects are listed in order of pk as without index
+    assert indexed_repo.get_all({'name': '1'}) == [moved] + objects[1::2]
+    assert indexed_repo.get_all({'name': '0'}) == objects[2::2]
+
+    indexed_repo.delete(objects[2].pk)
+    assert indexed_repo.get_all({'name': '0'}) == [objects[4]]
+    with pytest.raises(KeyError):
+        indexed_repo.delete(objects[2].pk)
+    assert indexed_repo.get_all({'name': '0'}) == [objects[4]]
@@ -0,0 +1,140 @@
+from dataclasses import dataclass
+from datetime import datetime
+
+from bookkeeper.models.category import Category
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+
+import pytest
+
+
+@pytest.fixture
+def custom_class():
+    @dataclass
+    class Custom():
+        name: str = ''
+        test: str = ''
+        value: float | None = None
+        pk: int = 0
+
+    return Custom
+
+
+@pytest.fixture
+def repo(custom_class):
+    repo = SQLiteRepository(':memory:', custom_class, indexed=['name'])
+    yield repo
+    repo.close()
+
+
+def test_crud(repo, custom_class):
+    obj = custom_class()
+    pk = repo.add(obj)
+    assert obj.pk == pk
+    assert repo.get(pk) == obj
+    obj2 = custom_class('name', value=1.5)
+    obj2.pk = pk
+    repo.update(obj2)
+    assert repo.get(pk) == obj2
+    repo.delete(pk)
+    assert repo.get(pk) is None
+
+
+def test_cannot_add_with_pk(repo, custom_class):
+    obj = custom_class()
+    obj.pk = 1
+    with pytest.raises(ValueError):
+        repo.add(obj)
+    with pytest.raises(ValueError):
+        repo.add_many([obj])
+
+
+def test_cannot_delete_unexistent(repo):
+    with pytest.raises(KeyError):
+        repo.delete(1)
+
+
+def test_cannot_update_without_pk(repo, custom_class):
+    obj = custom_class()
+    with pytest.raises(ValueError):
+        repo.update(obj)
+
+
+def test_cannot_update_unexistent(repo, custom_class):
+    obj = custom_class(pk=1)
+    with pytest.raises(KeyError):
+        repo.update(obj)
+
+
+def test_get_all(repo, custom_class):
+    objects = [custom_class() for i in range(5)]
+    for o in objects:
+        repo.add(o)
+    assert repo.get_all() == objects
+
+
+def test_get_all_with_condition(repo, custom_class):
+    objects = []
+    for i in range(5):
+        o = custom_class(str(i), 'test')
+        repo.add(o)
+        objects.append(o)
+    assert repo.get_all({'name': '0'}) == [objects[0]]
+    assert repo.get_all({'test': 'test'}) == objects
+    assert repo.get_all({'name': '1', 'test': 'test'}) == [objects[1]]
+    assert repo.get_all({'value': None}) == objects
+    with pytest.raises(ValueError):
+        repo.get_all({'unknown': 1})
+
+
+def test_get_all_uses_index(repo):
+    sql = repo._get_where_sql(('name',))
+    plan = repo._connection.execute('EXPLAIN QUERY PLAN ' + sql, ('0',)).fetchall()
+    assert 'USING INDEX idx_custom__name' in ' '.join(row[-1] for row in plan)
+
+
+def test_add_many_update_many(repo, custom_class):
+    repo.add(custom_class('first'))
+    objects = [custom_class(str(i)) for i in range(3)]
+    assert repo.add_many(objects) == [2, 3, 4]
+    assert [o.pk for o in objects] == [2, 3, 4]
+    for o in objects:
+        o.value = 1.0
+    repo.update_many(objects)
+    assert repo.get_all({'value': 1.0}) == objects
+    objects[0].pk = 100
+    with pytest.raises(KeyError):
+        repo.update_many(objects)
+    # The whole batch is rolled back
+    assert repo.get(3).value == 1.0
+
+
+def test_models(tmp_path):
+    db_file = str(tmp_path / 'test.sqlite')
+    cat_repo = SQLiteRepository(db_file, Category, indexed=['name'])
+    exp_repo = SQLiteRepository(db_file, Expense, indexed=['category'])
+    cats = Category.create_from_tree([('parent', None), ('child', 'parent')], cat_repo)
+    exp = Expense(10, cats[1].pk, datetime(2020, 1, 1, 12, 30), comment='test')
+    exp_repo.add(exp)
+    cat_repo.close()
+    exp_repo.close()
+
+    cat_repo = SQLiteRepository(db_file, Category)
+    exp_repo = SQLiteRepository(db_file, Expense)
+    assert cat_repo.get_all() == cats
+    assert exp_repo.get_all({'category': cats[1].pk}) == [exp]
+    assert exp_repo.get_all({'expense_date': datetime(2020, 1, 1, 12, 30)}) == [exp]
+    journal_mode = cat_repo._connection.execute('PRAGMA journal_mode').fetchone()[0]
+    assert journal_mode == 'wal'
+    cat_repo.close()
+    exp_repo.close()
+
+
+def test_unsupported_field_type():
+    @dataclass
+    class Unsupported():
+        value: list
+        pk: int = 0
+
+    with pytest.raises(TypeError):
+        SQLiteRepository(':memory:', Unsupported)
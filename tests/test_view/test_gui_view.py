@@ -0,0 +1,88 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+QtCore = pytest.importorskip("PySide6.QtCore")
+
+from bookkeeper.view.pyside_gui_view.expenses_table_widgets import (  # noqa: E402
+    ExpensesTableWidget,
+)
+from bookkeeper.view.pyside_gui_view.gui_view import GUI_Based_View  # noqa: E402
+from bookkeeper.view.view_data import ViewExpense  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def view():
+    return GUI_Based_View()
+
+
+def run_events(msec):
+    loop = QtCore.QEventLoop()
+    QtCore.QTimer.singleShot(msec, loop.quit)
+    loop.exec()
+
+
+def test_schedule(view):
+    called = []
+    view.schedule(datetime.now() + timedelta(milliseconds=50), lambda: called.append(1))
+    assert called == []
+    run_events(300)
+    assert called == [1]
+    # Handler is called once
+    run_events(100)
+    assert called == [1]
+
+
+def test_schedule_passed_moment(view):
+    called = []
+    view.schedule(datetime.now() - timedelta(days=1), lambda: called.append(1))
+    run_events(50)
+    assert called == [1]
+
+
+def test_schedule_from_handler(view):
+    called = []
+
+    def handler():
+        called.append(datetime.now())
+        if len(called) < 3:
+            view.schedule(datetime.now(), handler)
+
+    view.schedule(datetime.now(), handler)
+    run_events(300)
+    assert len(called) == 3
+
+
+def test_schedule_several(view):
+    called = []
+    view.schedule(datetime.now() + timedelta(milliseconds=30), lambda: called.append(2))
+    view.schedule(datetime.now(), lambda: called.append(1))
+    run_events(200)
+    assert called == [1, 2]
+    assert view._schedule_timers == set()
+
+
+def fill_table(table, num):
+    table.full_update(
+        [ViewExpense(i, "1.00", "food", "01/01/2024 00:00", "") for i in range(num)]
+    )
+
+
+def test_load_more_when_rows_fit(view):
+    table = ExpensesTableWidget()
+    calls = []
+    table.register_load_more_expenses_handler(lambda: calls.append(1))
+    # Hidden table has no scroll range, no expenses are requested
+    fill_table(table, 100)
+    assert calls == []
+    table.resize(400, 400)
+    table.show()
+    fill_table(table, 100)
+    assert calls == []
+    table.remove_expenses(list(range(90)))
+    assert calls == [1]
+    fill_table(table, 2)
+    assert calls == [1, 1]
+    table.close()